@@ -1,5 +1,26 @@
-import app.window # Triggers initial pygame import
-from app.game import Game
+import os
 
-def run():
-    Game().run()
+# pygame is only imported along with Game, so the cube model, solver and
+# batch tools can be imported without SDL or a display
+
+def run(cube_size=3):
+    from app.game import Game
+    game = Game(cube_size)
+
+    # RUBICKS_LISTEN=<socket path / host:port> accepts moves from other processes (see app.sources)
+    listen = os.environ.get('RUBICKS_LISTEN')
+    if listen:
+        import asyncio
+        from app import sources
+        try:
+            asyncio.run(game.run_async(sources.serve(game.cube, listen)))
+        finally:
+            sources.shutdown_executor()
+    else:
+        game.run()
+
+def __getattr__(name):
+    if name == 'Game':
+        from app.game import Game
+        return Game
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
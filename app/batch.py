@@ -0,0 +1,113 @@
+"""
+Headless batch scramble / apply / verify engine
+
+Reads one scramble per line (moves separated by whitespace, eg. "R U2 F'"),
+applies each to a solved cube and optionally solves it and verifies the
+solution. Results are written as one tab separated line per input line, in
+input order:
+
+    scramble <TAB> state (facelet colours, hex) <TAB> solution <TAB> status
+
+status is 'ok', 'failed' (solution did not solve the cube / none found
+within the length limit) or 'error: ...' for lines that could not be parsed.
+Without --solve the solution column is empty and status is 'ok'.
+
+Usage: python -m app.batch [input] [-o output] [--solve] [-j processes]
+"""
+
+import argparse
+import sys
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+
+from app.state import CubeState
+
+def process_line(line, solve=False, max_length=24):
+    """Result columns for a single scramble line"""
+    scramble = line.strip()
+    state = CubeState(3)
+    try:
+        state.apply_sequence(scramble.split())
+    except ValueError as e:
+        return scramble, '', '', f'error: {e}'
+
+    facelets = bytes(state.facelets).hex()
+    if not solve:
+        return scramble, facelets, '', 'ok'
+
+    from app import solver
+    solution = solver.solve(state, max_length)
+    if solution is None:
+        return scramble, facelets, '', 'failed'
+
+    state.apply_sequence(solution)
+    return scramble, facelets, ' '.join(solution), 'ok' if state.is_solved() else 'failed'
+
+def process_chunk(lines, solve=False, max_length=24):
+    return [process_line(line, solve, max_length) for line in lines]
+
+def _init_worker(solve):
+    if solve:
+        # Open the memory mapped solver tables once per worker
+        from app import solver
+        solver.get_tables()
+
+def chunks(lines, chunk_size):
+    lines = iter(lines)
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def run_batch(lines, solve=False, max_length=24, processes=None, chunk_size=1000):
+    """
+    Process scramble lines across a pool of worker processes
+
+    Generator of result tuples (see process_line) in input order. Input is
+    read lazily, with at most a few chunks per worker in flight, so memory
+    use does not grow with the input size.
+    """
+    lines = (line for line in lines if line.strip())
+    if processes is None:
+        processes = cpu_count()
+
+    if processes <= 1:
+        _init_worker(solve)
+        for chunk in chunks(lines, chunk_size):
+            yield from process_chunk(chunk, solve, max_length)
+        return
+
+    with Pool(processes, initializer=_init_worker, initargs=(solve, )) as pool:
+        pending = deque()
+        for chunk in chunks(lines, chunk_size):
+            pending.append(pool.apply_async(process_chunk, (chunk, solve, max_length)))
+            if len(pending) >= processes * 4:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply (and optionally solve and verify) cube scrambles in bulk')
+    parser.add_argument('input', nargs='?', help='scramble file, one per line (default: stdin)')
+    parser.add_argument('-o', '--output', help='result file (default: stdout)')
+    parser.add_argument('--solve', action='store_true', help='solve each scramble and verify the solution')
+    parser.add_argument('--max-length', type=int, default=24, help='maximum solution length')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='scrambles per work unit')
+    args = parser.parse_args(argv)
+
+    src = open(args.input) if args.input else sys.stdin
+    dst = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for result in run_batch(src, args.solve, args.max_length, args.processes, args.chunk_size):
+            dst.write('\t'.join(result) + '\n')
+    finally:
+        if args.input:
+            src.close()
+        if args.output:
+            dst.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+Benchmark suite for the state engine, animation and rendering
+
+Each benchmark is run for every cube size (and move sequence length where
+it applies), keeping the best of several repeats. Results are written as
+JSON, so runs from different versions can be compared:
+
+    {"python": ..., "platform": ..., "time": ..., "results": [
+        {"name": ..., "size": ..., "length": ..., "seconds": ...,
+         "ops": ..., "unit": ..., "per_second": ...}, ...]}
+
+seconds is the time for one run of ops units of work (cubes built, moves
+applied, frames drawn). Rendering benchmarks use the SDL dummy video driver,
+so no display is needed. Run from the repository root (assets are loaded
+relative to it).
+
+Usage: python -m app.bench [--sizes 2 3 5] [--lengths 20 100] [--repeat 5] [-o results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+from app.state import CubeState, FACE_MOVES
+from app.cube import Cube
+
+BENCHMARKS = {}
+
+def benchmark(unit, uses_length=True, render=False):
+    """Register a benchmark: a function of (size, length) doing any setup, and returning (run function, ops per run)"""
+    def register(func):
+        BENCHMARKS[func.__name__] = (func, unit, uses_length, render)
+        return func
+    return register
+
+def scramble(length, seed=0):
+    """Random face turn sequence (the same for every run with a given seed)"""
+    rng = random.Random(seed)
+    return [rng.choice(tuple(FACE_MOVES)) + rng.choice(('', '2', '\'')) for _ in range(length)]
+
+def animate(cube, dt=1 / 30):
+    """Run the cube animation until every queued move has been played, returning the number of frames"""
+    frames = 0
+    while cube.is_moving or cube.move_queue:
+        cube.update(dt)
+        frames += 1
+    return frames
+
+@benchmark('cubes', uses_length=False)
+def construct(size, length):
+    def run():
+        Cube(size)
+    return run, 1
+
+@benchmark('moves')
+def apply(size, length):
+    moves = scramble(length)
+    def run():
+        CubeState(size).apply_sequence(moves)
+    return run, length
+
+@benchmark('frames')
+def update(size, length):
+    moves = scramble(length)
+    cube = Cube(size)
+    frames = [0]
+    def run():
+        cube.move_queue.extend(moves)
+        frames[0] = animate(cube)
+    run() # Count frames per run (also warms the move caches)
+    return run, frames[0]
+
+def _game(size):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from app.game import Game
+    return Game(size, move_log=False, profiler_env=False) # Benchmark moves and timings stay out of the user's logs and traces
+
+@benchmark('frames', uses_length=False, render=True)
+def draw_cube(size, length):
+    # Projection, culling, depth sort and polygon drawing of a cube part way through a turn
+    game = _game(size)
+    game.cube.move_queue.append('R')
+    game.cube.update(0.25)
+    pen = game.cube_layer.pen
+    def run():
+        game.draw_cube(pen)
+    return run, 1
+
+@benchmark('frames', render=True)
+def frame(size, length):
+    # Whole frames (animation, cube, GUI and pointer) redrawn in full to the offscreen display surface
+    game = _game(size)
+    moves = scramble(length)
+    frames = [0]
+    def run():
+        game.cube.move_queue.extend(moves)
+        frames[0] = 0
+        while game.cube.is_moving or game.cube.move_queue:
+            game.events = []
+            game.full_redraw = True
+            game.gui_layer_state = None
+            game.frame()
+            frames[0] += 1
+    run()
+    return run, frames[0]
+
+@benchmark('frames', render=True)
+def wall(size, length):
+    # Whole frames of a 64 cube wall, every cube playing the same moves
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from app.wall import CubeWall
+    cubes = [Cube(size) for _ in range(64)]
+    wall = CubeWall(cubes)
+    wall.events = []
+    moves = scramble(length)
+    frames = [0]
+    def run():
+        frames[0] = 0
+        for cube in cubes:
+            cube.move_queue.extend(moves)
+        while cubes[0].is_moving or cubes[0].move_queue:
+            wall.frame()
+            frames[0] += 1
+    run()
+    return run, frames[0]
+
+def time_run(run, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run_benchmarks(names=None, sizes=(2, 3, 5), lengths=(20, 100), repeat=5, log=None):
+    """Run the selected benchmarks, returning a list of result dicts"""
+    results = []
+    for name in names or BENCHMARKS:
+        func, unit, uses_length, _ = BENCHMARKS[name]
+        for size in sizes:
+            for length in (lengths if uses_length else [None]):
+                run, ops = func(size, length)
+                seconds = time_run(run, repeat)
+                result = {
+                    'name': name,
+                    'size': size,
+                    'length': length,
+                    'seconds': seconds,
+                    'ops': ops,
+                    'unit': unit,
+                    'per_second': ops / seconds if seconds else None
+                }
+                results.append(result)
+                if log:
+                    log(result)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the cube model, animation and rendering')
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run: {", ".join(BENCHMARKS)} (default: all)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2, 3, 5], help='cube sizes')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[20, 100], help='move sequence lengths')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per benchmark (the fastest is kept)')
+    parser.add_argument('--no-render', action='store_true', help='skip the benchmarks needing pygame')
+    parser.add_argument('-o', '--output', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    names = args.names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name!r}')
+    if args.no_render:
+        names = [name for name in names if not BENCHMARKS[name][3]]
+
+    def log(result):
+        length = '' if result['length'] is None else f' x{result["length"]}'
+        print(f'{result["name"]:>10} {result["size"]}x{result["size"]}{length}: {result["per_second"]:.1f} {result["unit"]}/s', file=sys.stderr)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': run_benchmarks(names, args.sizes, args.lengths, args.repeat, log)
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
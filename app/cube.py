@@ -1,8 +1,12 @@
-from copy import deepcopy
 import random
-from app.trig import origin_rotate
+from functools import lru_cache
+from app.trig import rotation
+from app.state import CubeState, FACE_COLS, FACE_MOVES, facelet_index, other_axes
+from app.sequence import MoveQueue, decode, parse
 
 class RbxCol:
+    """Cube color - instances are interned, so RbxCol('Red') always returns the same object"""
+
     COLS = {
         'WHITE'  : (255, 255, 255),
         'RED'    : (255,   0,   0),
@@ -13,30 +17,49 @@ class RbxCol:
         'BLACK'  : ( 50,  50,  50)
     }
 
-    def __init__(self, name=None):
-        if name is None:
-            self._name = 'BLACK'
-        else:
-            self._name = name.upper()
-            assert self._name in self.COLS.keys(), 'Invalid color name'
+    __slots__ = ('_name', '_rgb')
+    _instances = {}
+
+    def __new__(cls, name=None):
+        name = 'BLACK' if name is None else name.upper()
+        col = cls._instances.get(name)
+        if col is None:
+            assert name in cls.COLS.keys(), 'Invalid color name'
+            col = super().__new__(cls)
+            col._name = name
+            col._rgb = cls.COLS[name]
+            cls._instances[name] = col
+        return col
 
     def rgb_vals(self):
-        return self.COLS[self._name]
+        return self._rgb
 
     @property
     def name(self):
         return self._name
 
+    # Only equal to other colors (compare names with RbxCol(name) or col.name), so equal colors hash alike
     def __eq__(self, other):
         if isinstance(other, RbxCol):
             return self._name == other._name
-        elif isinstance(other, str):
-            return self._name == other.upper()
-        else:
-            raise ValueError('Other must be RbxCol or string')
+        return NotImplemented
     
     def __ne__(self, other):
-        return not self.__eq__(other)
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __hash__(self):
+        return hash(self._name)
+
+    # Keep colors interned when copied or pickled
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return RbxCol, (self._name, )
 
     def __repr__(self):
         return f'<RbxCol(\'{self._name}\' RGB={self.rgb_vals()})>'
@@ -45,9 +68,12 @@ class RbxCol:
         return f'<COL/{self._name}>'
 
 class Tri:
-    def __init__(self, coords, col):
+    __slots__ = ('coords', 'col', 'indices')
+
+    def __init__(self, coords, col, indices=None):
         self.coords = coords
         self.col = col
+        self.indices = indices # Vertex indices within the cube vertex buffer
 
     def __repr__(self):
         return f'<Tri coords={self.coords} col={self.col}>'
@@ -55,21 +81,19 @@ class Tri:
 class Block:
     """Defines a single block within the cube"""
 
-    # Block color rules
-    # X=0, Y=1, Z=2
-    # (2, 2) Means when cube z == 2, face with z = 2 should be orange
-    SIDE_COLS = {
-        (0, 0): RbxCol('Green'), # -ve x: green face
-        (0, 2): RbxCol('Blue'), # +ve x: blue face
-        (1, 0): RbxCol('White'), # -ve y: white face
-        (1, 2): RbxCol('Yellow'), # +ve y: yellow face
-        (2, 0): RbxCol('Red'), # -ve z: red face
-        (2, 2): RbxCol('Orange'), # +ve z: yellow face
-    }
+    # Shared color instances, indexed by state color (see state.FACE_COLS)
+    STATE_COLS = [RbxCol(name) for name in FACE_COLS]
+    INTERIOR_COL = RbxCol()
 
+    # Block dimensions on a 3x3 cube (other cube sizes are scaled to the same overall size)
     CUBE_SIZE = 2 # Size of cube
     CUBE_PADD = 0.15 # Padding between cubes
-    CUBE_OFFSET = -1.5 * (CUBE_SIZE) - CUBE_PADD
+
+    @classmethod
+    def half_extent(cls, size):
+        """Distance from the centre to each outer face of a cube with `size` blocks per edge"""
+        scale = 3 / size
+        return (size * cls.CUBE_SIZE + (size - 1) * cls.CUBE_PADD) * scale / 2
 
     @staticmethod
     def gen_template_block():
@@ -97,36 +121,58 @@ class Block:
     
     TEMPLAETE_BLOCK_TRIS = gen_template_block()
 
-    def __init__(self, pos):
+    __slots__ = ('pos', 'cols', 'sticker_faces', 'vert_start', 'tris')
+
+    def __init__(self, pos, state, verts, size=3):
         self.pos = pos
 
         # Block face colors
         # Index 0: Axis (x, y, z), Index 1: -ve/+ve side of axis
-        self.cols = [[RbxCol() for _ in range(2)] for _ in range(3)]
-        self.new_cols = None
+        self.cols = [[self.INTERIOR_COL for _ in range(2)] for _ in range(3)]
 
-        # Apply color rules to block faces depending on cube position
-        for (axis, val), col in self.SIDE_COLS.items():
-            if self.pos[axis] == val:
-                self.cols[axis][val//2] = col
+        # (axis, side, facelet index) of each block face on the outside of the cube
+        self.sticker_faces = []
+        for axis_i in range(3):
+            for side_i in range(2):
+                i = facelet_index(size, pos, axis_i, side_i)
+                if i is not None:
+                    self.sticker_faces.append((axis_i, side_i, i))
+        self.load_cols(state)
+
+        # Add the 8 block corners to the shared cube vertex buffer
+        # Corner index within the block: x * 4 + y * 2 + z (each 0/1)
+        self.vert_start = len(verts)
+        scale = 3 / size
+        block_size = self.CUBE_SIZE * scale
+        pitch = (self.CUBE_SIZE + self.CUBE_PADD) * scale
+        offset = -self.half_extent(size)
+        for corner in range(8):
+            bits = (corner >> 2 & 1, corner >> 1 & 1, corner & 1)
+            # Scale and translate block
+            verts.append([(pitch * self.pos[i]) + (bits[i] * block_size) + offset for i in range(3)])
         
         # Generate block tris (each pair of triangles corresponds to a face color)
         # Index 0: Axis (x, y, z), Index 1: -ve/+ve side of axis (contains both tris)
-        self.tris = deepcopy(self.TEMPLAETE_BLOCK_TRIS)
-        for axis_i in range(3):
-            for side_i in range(2):
-                for pair_i in range(2):
-                    tri = self.tris[axis_i][side_i][pair_i] # Select tri
-                    # Update value of each coordinate (scale and translate block)
-                    for vtx in tri.coords:
-                        for i in range(3):
-                            vtx[i] = ((self.CUBE_SIZE + self.CUBE_PADD) * self.pos[i]) + (vtx[i] * self.CUBE_SIZE) + self.CUBE_OFFSET
+        # Tri coords reference the shared vertices, so rotating the buffer moves the tris
+        self.tris = [[[self.gen_tri(tri, verts) for tri in side] for side in axis] for axis in self.TEMPLAETE_BLOCK_TRIS]
         
         # Set tri cols
         self.update_tri_cols()
-        
-        # Create reusable copy of tris
-        self.tris_original = deepcopy(self.tris)
+
+    def gen_tri(self, template_tri, verts):
+        indices = tuple(self.vert_start + x * 4 + y * 2 + z for x, y, z in template_tri.coords)
+        return Tri([verts[i] for i in indices], None, indices)
+
+    @property
+    def vert_indices(self):
+        """Indices of the block corners within the cube vertex buffer"""
+        return range(self.vert_start, self.vert_start + 8)
+
+    def load_cols(self, state):
+        """Read block face colors from the cube state"""
+        facelets = state.facelets
+        for axis_i, side_i, i in self.sticker_faces:
+            self.cols[axis_i][side_i] = self.STATE_COLS[facelets[i]]
 
     def update_tri_cols(self):
         for axis_i in range(3):
@@ -146,27 +192,92 @@ class Block:
         return f'<Block {self.pos} {cols}>'
 
 class Cube:
-    def __init__(self):
-        self.blocks = [[[Block([x, y, z]) for z in range(3)] for y in range(3)] for x in range(3)]
-
-        self.cube_rot_speed = 90 / 20 # Degrees per frame
-
-        # Rotation of cubes when (Axis (X=0/Y=1/Z=2) == Side (-ve=0/+ve=2))
-        self.moves = {
-            'L': (0, 0),
-            'R': (0, 2),
-            'U': (1, 0),
-            'D': (1, 2),
-            'F': (2, 0),
-            'B': (2, 2)
-        }
-        self.move_queue = []
+    TURN_SPEED = 90 / 20 * 30 # Degrees per second
+
+    def __init__(self, size=3):
+        self.size = size
+        self.state = CubeState(size)
+
+        # Vertex buffer shared by all blocks: [x, y, z] per block corner
+        # Blocks inside the cube can never be seen, so only the outer shell of blocks is created
+        self.verts = []
+        self.blocks = []
+        for x in range(size):
+            for y in range(size):
+                for z in range(size):
+                    pos = [x, y, z]
+                    if any(val in (0, size - 1) for val in pos):
+                        self.blocks.append(Block(pos, self.state, self.verts, size))
+        self.verts_original = [tuple(vtx) for vtx in self.verts]
+
+        # Flat list of all tris (and their vertex indices) for rendering
+        # Block faces for culling: (tri ids, face diagonal vertex indices, block diagonal vertex indices, interior)
+        # Facelet index of each tri (None for interior faces), and the unturned centre of each facelet, for picking
+        self.tris = []
+        self.faces = []
+        self.tri_facelets = []
+        self.facelet_centres = [None] * (6 * size * size)
+        for block in self.blocks:
+            block_diag = (block.vert_start, block.vert_start + 7)
+            for axis_i, axis in enumerate(block.tris):
+                for side_i, side in enumerate(axis):
+                    tri_ids = tuple(range(len(self.tris), len(self.tris) + len(side)))
+                    self.tris.extend(side)
+                    facelet = facelet_index(size, block.pos, axis_i, side_i)
+                    face_diag = side[0].indices[:2]
+                    self.faces.append((tri_ids, face_diag, block_diag, facelet is None))
+                    self.tri_facelets.extend([facelet] * len(side))
+                    if facelet is not None:
+                        v0, v1 = (self.verts[i] for i in face_diag)
+                        self.facelet_centres[facelet] = tuple((a + b) / 2 for a, b in zip(v0, v1))
+        self.tri_indices = [tri.indices for tri in self.tris]
+
+        # Outer faces of the whole cube (4 corners each)
+        # Drawn behind the stickers to fill the gaps between blocks, in place of the hidden interior faces
+        high = Block.half_extent(size)
+        low = -high
+        self.hull_faces = []
+        for axis in range(3):
+            for side in (low, high):
+                a, b = other_axes(axis)
+                quad = []
+                for u, v in ((low, low), (low, high), (high, high), (high, low)):
+                    corner = [0, 0, 0]
+                    corner[axis], corner[a], corner[b] = side, u, v
+                    quad.append(corner)
+                self.hull_faces.append(quad)
+
+        # Blocks and vertex indices of each layer
+        # Index 0: Axis (x, y, z), Index 1: Layer position along axis
+        self.layer_blocks = [[[] for _ in range(size)] for _ in range(3)]
+        self.layer_verts = [[[] for _ in range(size)] for _ in range(3)]
+        for block in self.blocks:
+            for axis in range(3):
+                self.layer_blocks[axis][block.pos[axis]].append(block)
+                self.layer_verts[axis][block.pos[axis]].extend(block.vert_indices)
+
+        self.turn_speed = self.TURN_SPEED
+
+        # Fast forward: animation speeds up as the queue grows, and moves queued
+        # beyond max_queue are applied instantly, so long replays finish in bounded time
+        self.fast_forward = False
+        self.fast_forward_rate = 0.5 # Extra speed per queued move (x turn_speed)
+        self.max_queue = 20
+
+        # Face turns (see state.parse_move for the full notation, including slice and wide moves)
+        self.moves = FACE_MOVES
+        self.move_queue = MoveQueue(size)
         # self.move_queue = ['L2', 'U-', 'F2']
         # for _ in range(100):
         #     move = random.choice(list(self.moves.keys()))
         #     move += random.choice(('', '2', '-'))
         #     self.move_queue.append(move)
 
+        # Optional movelog.MoveRecorder, given every move committed to the state
+        self.recorder = None
+
+        self.move_verts_cache = {}
+        self.changed = True # Set whenever vertices or colors change - cleared by the renderer
         self.is_moving = False
         self.load_next_move()
 
@@ -176,92 +287,176 @@ class Cube:
             return
 
         self.is_moving = True
-        move = self.move_queue.pop(0).upper()
-        self.move_axis, self.move_side = self.moves[move[0]]
+        self.move_code = self.move_queue.popleft()
+        self.move_axis, self.move_layers, turns = decode(self.move_code)
 
         self.move_rot = 90
-        self.move_amt = self.cube_rot_speed
+        self.move_dir = 1
         self.move_curr_rot = 0
 
-        if len(move) == 2:
-            if move[1] == '2': # Double move
-                self.move_rot *= 2
-            elif move[1] == '\'': # Reverse (prime / -90 degrees) move
-                self.move_rot *= -1
-                self.move_amt *= -1
+        if turns == 2: # Double move
+            self.move_rot *= 2
+        elif turns == 3: # Reverse (prime / -90 degrees) move
+            self.move_rot *= -1
+            self.move_dir = -1
         
-        self.rot_index = [0, 1, 2]
-        self.rot_index.remove(self.move_axis)
+        self.rot_index = other_axes(self.move_axis)
+
+        # Vertices of all turning layers
+        key = (self.move_axis, self.move_layers)
+        self.move_verts = self.move_verts_cache.get(key)
+        if self.move_verts is None:
+            self.move_verts = [i for layer in self.move_layers for i in self.layer_verts[self.move_axis][layer]]
+            self.move_verts_cache[key] = self.move_verts
+
+    def current_speed(self):
+        """Animation speed in degrees per second"""
+        if self.fast_forward:
+            return self.turn_speed * (1 + len(self.move_queue) * self.fast_forward_rate)
+        return self.turn_speed
     
-    def update(self):
+    def update(self, dt=1 / 30):
+        """Advance the animation by dt seconds"""
+        if self.fast_forward and len(self.move_queue) > self.max_queue:
+            excess = [self.move_queue.popleft() for _ in range(len(self.move_queue) - self.max_queue)]
+            self.apply_moves(excess)
+
         if not self.is_moving:
             self.load_next_move()
 
+        # Time left over after a move completes carries on into the next move
+        while self.is_moving and dt > 0:
+            speed = self.current_speed()
+            step = speed * dt
+            remaining = abs(self.move_rot - self.move_curr_rot)
+            if step < remaining - 1e-9:
+                self.move_curr_rot += step * self.move_dir
+                self.rotate_layer(self.move_curr_rot)
+                return
+
+            dt -= remaining / speed
+            self.is_moving = False
+            self.handle_rotation_complete()
+            if dt > 0:
+                self.load_next_move()
+
+    def finish_move(self):
+        """Complete the move currently being animated straight away"""
         if self.is_moving:
-            # rot = (self.move_rot * 2 - self.move_curr_rot) / 40 + self.move_amt / 5
-            for plane in self.blocks:
-                for row in plane:
-                    for block in row:
-                        if block.pos[self.move_axis] == self.move_side:
-                            for axis in block.tris:
-                                for side in axis:
-                                    for tri in side:
-                                        for vtx in tri.coords:
-                                            vtx[self.rot_index[0]], vtx[self.rot_index[1]] = origin_rotate(vtx[self.rot_index[0]], vtx[self.rot_index[1]], self.move_amt)
-
-            self.move_curr_rot += self.move_amt
-            if self.move_amt > 0: # +ve move amoutn
-                if self.move_curr_rot >= self.move_rot:
-                    self.is_moving = False
-                    self.handle_rotation_complete()
-            else: # -ve move amount
-                if self.move_curr_rot <= self.move_rot:
-                    self.is_moving = False
-                    self.handle_rotation_complete()
+            self.is_moving = False
+            self.handle_rotation_complete()
+
+    def apply_moves(self, moves):
+        """
+        Commit moves (strings or move codes) straight to the cube state without animating them
+
+        The move being animated is completed first; moves still in the queue
+        are played after these.
+        """
+        self.finish_move()
+        for code in parse(moves, self.size):
+            self.state.apply_turn(*decode(code))
+            if self.recorder:
+                self.recorder.record(code)
+        self.refresh_blocks()
+
+    def skip_queue(self):
+        """Instantly apply every queued move"""
+        moves = list(self.move_queue)
+        self.move_queue.clear()
+        self.apply_moves(moves)
+
+    def set_state(self, state):
+        """Jump to a CubeState, dropping any queued moves"""
+        self.move_queue.clear()
+        self.finish_move()
+        self.state.facelets[:] = state.facelets
+        self.refresh_blocks()
+        if self.recorder:
+            self.recorder.state = self.state.copy()
+            self.recorder.checkpoint()
+
+    def refresh_blocks(self):
+        """Reload every block's colors from the cube state"""
+        for block in self.blocks:
+            block.load_cols(self.state)
+            block.update_tri_cols()
+        self.changed = True
     
+    def rotate_layer(self, angle):
+        """Set the moving layers' vertices to their original position rotated (clockwise) by an angle"""
+        rotation(angle).rotate_axes(self.verts, self.verts_original, self.move_verts, *self.rot_index)
+        self.changed = True
+
+    def reset_layer(self):
+        """Restore the moving layers' vertices to their original position"""
+        verts, original = self.verts, self.verts_original
+        for i in self.move_verts:
+            verts[i][:] = original[i]
+
     def handle_rotation_complete(self):
-        for plane in self.blocks:
-            for row in plane:
-                for block in row:
-                    # For blocks involved in rotation
-                    if block.pos[self.move_axis] == self.move_side:
-
-                        # Reset all tri positions
-                        block.tris = deepcopy(block.tris_original)
-
-                        # Calculate destination block position
-                        pos = [x - 1 for x in block.pos] # Shift so 0 is centre
-                        pos[self.rot_index[0]], pos[self.rot_index[1]] = [round(x) for x in origin_rotate(pos[self.rot_index[0]], pos[self.rot_index[1]], self.move_rot)] # Perform rotation
-                        pos = [x + 1 for x in pos] # Shift back so 1 is centre
-
-                        cols = deepcopy(block.cols)
-                        if self.move_rot == 180: # Half turn
-                            cols[self.rot_index[0]][0], cols[self.rot_index[0]][1] = cols[self.rot_index[0]][1], cols[self.rot_index[0]][0]
-                            cols[self.rot_index[1]][0], cols[self.rot_index[1]][1] = cols[self.rot_index[1]][1], cols[self.rot_index[1]][0]
-                        elif self.move_rot == 90: # Quarter clockwise turn
-                            cols[self.rot_index[0]][0], cols[self.rot_index[0]][1], cols[self.rot_index[1]][0], cols[self.rot_index[1]][1] = cols[self.rot_index[1]][0], cols[self.rot_index[1]][1], cols[self.rot_index[0]][1], cols[self.rot_index[0]][0]
-                        elif self.move_rot == -90: # Quarter anticlockwise turn
-                            cols[self.rot_index[0]][0], cols[self.rot_index[0]][1], cols[self.rot_index[1]][0], cols[self.rot_index[1]][1] = cols[self.rot_index[1]][1], cols[self.rot_index[1]][0], cols[self.rot_index[0]][0], cols[self.rot_index[0]][1]
-
-                        self.blocks[pos[0]][pos[1]][pos[2]].new_cols = cols
-
-        # Update colors
-        for plane in self.blocks:
-            for row in plane:
-                for block in row:
-                    # For blocks involved in rotation, update those with new color to be set
-                    if block.pos[self.move_axis] == self.move_side:
-                        if block.new_cols is not None:
-                            block.cols = block.new_cols
-                            block.update_tri_cols()
-                            block.new_cols = None
+        # Commit the turn to the cube state
+        self.state.apply_turn(self.move_axis, self.move_layers, self.move_rot // 90)
+        if self.recorder:
+            self.recorder.record(self.move_code)
+
+        # Reset all tri positions
+        self.reset_layer()
+
+        # Update colors of blocks involved in rotation from the new state
+        for layer in self.move_layers:
+            for block in self.layer_blocks[self.move_axis][layer]:
+                block.load_cols(self.state)
+                block.update_tri_cols()
+        self.changed = True
 
     def __repr__(self):
         return f'<Cube blocks={self.blocks}>'
 
+class CubeMesh:
+    """
+    Unturned geometry shared by every cube of a size, for drawing many cubes from one template
+
+    Holds the vertex buffer of a solved cube (in the same order as
+    Cube.verts) and every sticker as a quad of vertex indices, so an
+    instance only needs its state (and, while turning, its vertices) to be
+    drawn.
+    """
+
+    def __init__(self, size=3):
+        template = Cube(size)
+        self.size = size
+        self.verts = template.verts_original
+
+        # Block position: index of the block's first vertex (corners follow in x * 4 + y * 2 + z order)
+        self.block_verts = {tuple(block.pos): block.vert_start for block in template.blocks}
+
+        # (quad vertex indices in winding order, block position, axis, side, facelet index)
+        self.stickers = []
+        for block in template.blocks:
+            for axis_i, side_i, facelet in block.sticker_faces:
+                # Both tris of a face start with the same face diagonal, and end at the other two corners
+                tri_a, tri_b = block.tris[axis_i][side_i]
+                i0, i1, corner_a = tri_a.indices
+                quad = (i0, corner_a, i1, tri_b.indices[2])
+                self.stickers.append((quad, tuple(block.pos), axis_i, side_i, facelet))
+
+    def box_corner(self, low, high, corner):
+        """
+        Vertex index of a corner of the box around the blocks from position low to high
+
+        corner is (x, y, z), each 0 (low side) or 1 (high side).
+        """
+        pos = tuple(high[i] if bit else low[i] for i, bit in enumerate(corner))
+        return self.block_verts[pos] + corner[0] * 4 + corner[1] * 2 + corner[2]
+
+@lru_cache(maxsize=None)
+def cube_mesh(size=3):
+    return CubeMesh(size)
+
 if __name__ == '__main__':
     tot = 0
-    tris = Cube().blocks[0][0][0].tris
+    tris = Cube().blocks[0].tris
     for axis in tris:
         for side in axis:
             tot += len(side)
@@ -0,0 +1,243 @@
+"""
+Headless frame export: cube animations rendered offscreen to PNG sequences or raw RGB video
+
+Frames are drawn exactly as in the window (Game.draw_cube, animated by
+Cube.update) but onto offscreen surfaces under the SDL dummy video driver,
+as fast as they can be drawn rather than at the window frame rate.
+
+Moves are animated back to back, one frame every 1 / fps seconds of
+animation time, plus a final frame of the finished cube. State resets in
+a move log are jumped to between moves. The frames are split into
+segments, and each segment is rendered by a worker process starting from
+the checkpointed state before the move in progress at its first frame, so
+segments render independently and in parallel (with the same frames as a
+single process).
+
+Raw video is RGB24, frame after frame, eg. for
+    ffmpeg -f rawvideo -pix_fmt rgb24 -s 600x500 -r 30 -i - out.mp4
+
+Usage: python -m app.export (--moves "R U R' U'" [--scramble ...] | --log file) (-o dir | --raw file/-) [-j processes]
+"""
+
+import argparse
+import os
+import sys
+from bisect import bisect_right
+from collections import deque
+from itertools import accumulate
+from multiprocessing import Pool, cpu_count
+
+from app.state import CubeState
+from app.sequence import decode, parse
+
+def parse_items(moves, size=3):
+    """Move codes of a sequence (see sequence.parse), keeping any CubeStates (state jumps, eg. from a move log) in place"""
+    if isinstance(moves, str):
+        return parse(moves, size)
+    return [move if isinstance(move, CubeState) else parse((move, ), size)[0] for move in moves]
+
+def advance(state, items):
+    """State after applying move codes / jumping to CubeStates (state may be updated in place)"""
+    for item in items:
+        if isinstance(item, CubeState):
+            state = item.copy()
+        else:
+            state.apply_turn(*decode(item))
+    return state
+
+class Timeline:
+    """
+    Start time of every move, and the frames covering the whole animation
+
+    Codes may include CubeStates, which are jumped to (taking no time).
+    """
+
+    def __init__(self, codes, fps=30, turn_speed=None):
+        if turn_speed is None:
+            from app.cube import Cube
+            turn_speed = Cube.TURN_SPEED
+        self.codes = codes
+        self.fps = fps
+        self.turn_speed = turn_speed
+
+        durations = [0 if isinstance(code, CubeState) else (180 if decode(code)[2] == 2 else 90) / turn_speed for code in codes]
+        self.starts = [0] + list(accumulate(durations))
+        self.frames = int(self.starts[-1] * fps + 1e-9) + 1
+
+    def move_at(self, frame):
+        """Number of the move in progress at a frame (len(codes) once every move is done)"""
+        return min(bisect_right(self.starts, frame / self.fps + 1e-9) - 1, len(self.codes))
+
+    def segments(self, state, frames_per_segment=60):
+        """
+        Render jobs covering every frame: (first frame, end frame, move number, state before the move)
+
+        Checkpoint states are found by applying the moves to a copy of state,
+        without animating anything.
+        """
+        state = state.copy()
+        applied = 0
+        for first in range(0, self.frames, frames_per_segment):
+            move = self.move_at(first)
+            state = advance(state, self.codes[applied:move])
+            applied = move
+            yield first, min(first + frames_per_segment, self.frames), move, state.copy()
+
+class FrameRenderer:
+    """
+    Draws cube frames offscreen with a headless Game
+
+    Frames are the cube area of the window (without the GUI panel),
+    optionally scaled to frame_size.
+    """
+
+    def __init__(self, size=3, frame_size=None):
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_NO_SIGNAL_HANDLERS', '1') # SDL would otherwise catch SIGTERM, so pools could not terminate workers
+        from app.game import Game
+        # Exported frames are not moves made (and follow their own timeline), and workers must not profile themselves
+        self.game = Game(size, move_log=False, profiler_env=False)
+        self.cube = self.game.cube
+        self.frame_size = tuple(frame_size) if frame_size else self.game.cube_rect.size
+
+    def draw(self):
+        """Surface with the cube drawn as it is now (reused by the next frame - copy it to keep it)"""
+        import pygame as pg
+        game = self.game
+        game.draw_cube_layer(game.get_view())
+        frame = game.cube_layer.surface.subsurface(game.cube_rect)
+        if frame.get_size() != self.frame_size:
+            frame = pg.transform.smoothscale(frame, self.frame_size)
+        return frame
+
+    def render(self, timeline, first, end, move, state):
+        """
+        Generator of the surfaces of frames first to end - 1 (see Timeline.segments)
+
+        Every frame is set up from scratch (the state before its move, then
+        Cube.update by the time into the move), so a frame is drawn the same
+        whichever segment it falls in.
+        """
+        cube = self.cube
+        cube.turn_speed = timeline.turn_speed
+        codes, fps = timeline.codes, timeline.fps
+        state = state.copy()
+        for frame in range(first, end):
+            frame_move = timeline.move_at(frame)
+            state = advance(state, codes[move:frame_move])
+            move = frame_move
+
+            cube.set_state(state)
+            offset = frame / fps - timeline.starts[move]
+            if move < len(codes) and offset > 1e-9:
+                cube.move_queue.append(codes[move])
+                cube.update(offset)
+            yield self.draw()
+
+def to_rgb(surface):
+    """Raw RGB24 bytes of a surface"""
+    import pygame as pg
+    return pg.image.tobytes(surface, 'RGB')
+
+def render_frames(state, moves, size=3, fps=30, turn_speed=None, frame_size=None):
+    """Generator of the surfaces of an animation (in this process, reusing one surface)"""
+    timeline = Timeline(parse_items(moves, size), fps, turn_speed)
+    renderer = FrameRenderer(size, frame_size)
+    yield from renderer.render(timeline, 0, timeline.frames, 0, state)
+
+_renderer = None
+
+def _init_worker(size, frame_size):
+    global _renderer
+    _renderer = FrameRenderer(size, frame_size)
+
+def _render_png(timeline, job, directory):
+    import pygame as pg
+    first = job[0]
+    for i, surface in enumerate(_renderer.render(timeline, *job)):
+        pg.image.save(surface, os.path.join(directory, f'frame_{first + i:06d}.png'))
+    return job[1] - first
+
+def _render_raw(timeline, job):
+    return b''.join(to_rgb(surface) for surface in _renderer.render(timeline, *job))
+
+def _run_segments(func, args, timeline, state, size, frame_size, processes, frames_per_segment):
+    """Results of func(timeline, job, *args) for every segment, in order"""
+    jobs = timeline.segments(state, frames_per_segment)
+    if processes is None:
+        processes = cpu_count()
+
+    if processes <= 1:
+        _init_worker(size, frame_size)
+        for job in jobs:
+            yield func(timeline, job, *args)
+        return
+
+    with Pool(processes, initializer=_init_worker, initargs=(size, frame_size)) as pool:
+        # A few segments per worker in flight, so raw frames do not pile up in memory
+        pending = deque()
+        for job in jobs:
+            pending.append(pool.apply_async(func, (timeline, job) + args))
+            if len(pending) >= processes * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        pool.close()
+        pool.join()
+
+def export_png(directory, state, moves, size=3, fps=30, turn_speed=None, frame_size=None, processes=None, frames_per_segment=60):
+    """Render an animation to directory/frame_000000.png, ... - returns the number of frames"""
+    os.makedirs(directory, exist_ok=True)
+    timeline = Timeline(parse_items(moves, size), fps, turn_speed)
+    return sum(_run_segments(_render_png, (directory, ), timeline, state, size, frame_size, processes, frames_per_segment))
+
+def export_raw(out, state, moves, size=3, fps=30, turn_speed=None, frame_size=None, processes=None, frames_per_segment=30):
+    """Write an animation to a binary file object as raw RGB24 frames - returns the number of frames"""
+    timeline = Timeline(parse_items(moves, size), fps, turn_speed)
+    for data in _run_segments(_render_raw, (), timeline, state, size, frame_size, processes, frames_per_segment):
+        out.write(data)
+    return timeline.frames
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render cube animations to PNG frames or raw RGB24 video')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--moves', help='moves to animate, eg. "R U R\' U\'"')
+    source.add_argument('--log', help='animate the moves of a move log (see app.movelog)')
+    parser.add_argument('--scramble', default='', help='moves applied (not animated) before --moves')
+    parser.add_argument('--size', type=int, default=3, help='cube size (for --moves)')
+    parser.add_argument('--start', type=int, default=0, help='first move of the log to animate')
+    parser.add_argument('--end', type=int, help='move of the log to stop at')
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('-o', '--output', help='directory for PNG frames')
+    output.add_argument('--raw', help='raw RGB24 video file (- for stdout)')
+    parser.add_argument('--fps', type=float, default=30, help='frames per second of animation')
+    parser.add_argument('--turn-time', type=float, help='seconds per quarter turn (default: as in the window)')
+    parser.add_argument('--frame-size', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'), help='scale frames, eg. for thumbnails')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='worker processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    if args.log:
+        from app.movelog import MoveLog
+        log = MoveLog(args.log)
+        size = log.size
+        state, events = log.seek(args.start)
+        moves = [item for number, _, item in events if args.end is None or number < args.end] # Including state resets
+    else:
+        size = args.size
+        state = CubeState(size)
+        state.apply_sequence(args.scramble.split())
+        moves = args.moves
+
+    turn_speed = 90 / args.turn_time if args.turn_time else None
+    options = dict(size=size, fps=args.fps, turn_speed=turn_speed, frame_size=args.frame_size, processes=args.processes)
+    if args.output:
+        frames = export_png(args.output, state, moves, **options)
+    elif args.raw == '-':
+        frames = export_raw(sys.stdout.buffer, state, moves, **options)
+    else:
+        with open(args.raw, 'wb') as out:
+            frames = export_raw(out, state, moves, **options)
+    print(f'{frames} frames', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
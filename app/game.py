@@ -1,24 +1,34 @@
-from math import sqrt
 import os
+import sys
 
+from app.window import GameWindow, Color, Font, Layer # Triggers initial pygame import
 import pygame as pg
 
-from app.window import GameWindow, Color, Font
-from app.trig import tan, origin_rotate
-from app.cube import Cube
+from app.trig import tan
+from app.projection import ViewTransform, depth_order, is_front_facing
+from app.profiler import Profiler, JsonLinesExporter, ChromeTraceExporter
+from app.movelog import MoveRecorder, MoveLog, Replayer
+from app.cube import Cube, Block
+from app.state import move_perm, other_axes
+from app.sequence import encode
 
 class Game(GameWindow):
     ASSET_DIR = 'app/asset'
     FPS = 30
     BG_COL = Color.L_Gray
     WINDOW_SIZE = (800, 500)
+    DIRTY_RECTS = True
 
-    def __init__(self):
-        self.cube = Cube()
+    def __init__(self, cube_size=3, move_log=True, profiler_env=True):
+        self.cube = Cube(cube_size)
         self.init_window()
         self.init_camera()
         self.init_mouse()
         self.init_gui()
+        self.init_layers()
+        self.init_picking()
+        self.init_profiler(profiler_env)
+        self.init_move_log(move_log)
 
     def init_window(self):
         super().__init__(self.WINDOW_SIZE)
@@ -29,6 +39,7 @@ class Game(GameWindow):
         self.pitch = 30 # 0-360: (0 = level)
         self.yaw = 45 # 0-360: (0 = down +z axis)
         self.pos = [-10, -8, -10] # X, Y, Z
+        self.view = None
 
     def set_fov(self, fov_val):
         self.projection_dist = (self.width / 2) / tan(fov_val / 2)
@@ -84,110 +95,346 @@ class Game(GameWindow):
 
             curr_height += btn_height
 
+        # Pre-rendered GUI panel, redrawn only when the hovered / pressed button changes
+        self.gui_layer = Layer((self.gui_width, self.height))
+        self.gui_layer_state = None
+
+    def init_layers(self):
+        # The cube is rendered offscreen and only re-rasterised when it or the camera changes
+        self.cube_layer = Layer(self.WINDOW_SIZE)
+        self.cube_layer_view = None
+        self.cube_rect = pg.Rect(self.gui_width, 0, self.width - self.gui_width, self.height)
+        self.gui_rect = pg.Rect(0, 0, self.gui_width, self.height)
+        self.pointer_rect = None # Screen area covered by the pointer last frame
+        self.full_redraw = True
+
+    def init_picking(self):
+        # Facelet ID buffer: the cube drawn with every sticker filled with its facelet index + 1 (0 elsewhere)
+        # Only redrawn when a click needs it and the camera or cube geometry changed, so frames never pay for it
+        self.pick_layer = Layer(self.WINDOW_SIZE, depth=32) # Exact 24 bit ID colours, whatever the display depth
+        self.pick_key = None
+        self.pick_cols = [(0, 0, 0) if i is None else ((i + 1) >> 16 & 0xff, (i + 1) >> 8 & 0xff, (i + 1) & 0xff) for i in self.cube.tri_facelets]
+
+        # Dragging a sticker turns the layer it would move along: (facelet index, mouse position at the start)
+        self.drag = None
+        self.drag_dist = 10 # Pixels moved before a drag is turned into a move
+
+    def init_profiler(self, from_env=True):
+        # Toggled with F3, or enabled from the start with RUBICKS_PROFILE=1
+        # RUBICKS_TRACE=<file> also writes a per-frame trace (Chrome trace format for .json files, otherwise JSON lines)
+        # Neither applies to a Game built with profiler_env=False (eg. headless frame export and benchmarks)
+        self.overlay_font = Font(self.screen, 'app/asset/font/SFNS.ttf', size=14, cache_size=64)
+        self.overlay_layer = None
+        self.overlay_refresh = 0.5 # Seconds between overlay updates
+        self.overlay_age = 0
+
+        trace_path = os.environ.get('RUBICKS_TRACE')
+        if from_env and (os.environ.get('RUBICKS_PROFILE') or trace_path):
+            self.enable_profiler(trace_path)
+
+    def enable_profiler(self, trace_path=None):
+        """Add timing spans around the hot paths, shown in an overlay (and optionally written to a trace file)"""
+        exporters = []
+        if trace_path:
+            exporter = ChromeTraceExporter if trace_path.endswith('.json') else JsonLinesExporter
+            exporters.append(exporter(trace_path))
+
+        profiler = Profiler(exporters=exporters)
+        profiler.instrument(Game, 'handle_events', 'events')
+        profiler.instrument(Cube, 'update', 'cube update')
+        profiler.instrument(ViewTransform, 'transform', 'projection')
+        profiler.instrument(ViewTransform, 'project', 'projection')
+        profiler.instrument(sys.modules[__name__], 'depth_order', 'depth sort')
+        profiler.instrument(type(self.pen), 'draw_polygon', 'polygons')
+        profiler.instrument(Game, 'draw_gui', 'gui')
+        profiler.instrument(GameWindow, 'present', 'display update')
+        self.profiler = profiler
+        self.overlay_age = self.overlay_refresh
+
+    def disable_profiler(self):
+        self.profiler.uninstall()
+        self.profiler = None
+        self.overlay_layer = None
+        self.full_redraw = True
+
+    def init_move_log(self, enabled=True):
+        # RUBICKS_RECORD=<file> appends every move made to a move log
+        # RUBICKS_REPLAY=<file> plays a move log back (from move RUBICKS_REPLAY_FROM, default 0)
+        # Neither applies to a Game built with move_log=False (eg. headless frame export and benchmarks)
+        self.replayer = None
+        if not enabled:
+            return
+        replay_path = os.environ.get('RUBICKS_REPLAY')
+        if replay_path:
+            start = int(os.environ.get('RUBICKS_REPLAY_FROM', 0))
+            self.replayer = Replayer(MoveLog(replay_path), self.cube, start)
+
+        record_path = os.environ.get('RUBICKS_RECORD')
+        if record_path:
+            self.cube.recorder = MoveRecorder(record_path, self.cube.size, self.cube.state)
+
+    def on_exit(self):
+        super().on_exit()
+        if self.cube.recorder:
+            self.cube.recorder.close()
+
     def load_img(self, fname):
         """Load an image from the asset directory"""
         return pg.image.load(os.path.join(self.ASSET_DIR, fname))
 
     def frame(self):
         self.update()
-        self.render()
+        return self.render()
 
     def update(self):
         self.handle_events()
-        self.cube.update()
+        if self.replayer:
+            self.replayer.update(self.dt)
+        self.cube.update(self.dt)
 
     def handle_events(self):
         self.mouse_pos = pg.mouse.get_pos()
 
         for evt in self.events:
+            if evt.type in (pg.VIDEOEXPOSE, pg.WINDOWEXPOSED):
+                self.full_redraw = True
+            if evt.type == pg.KEYDOWN and evt.key == pg.K_F3:
+                if self.profiler:
+                    self.disable_profiler()
+                else:
+                    self.enable_profiler()
             if evt.type == pg.MOUSEBUTTONDOWN:
                 for btn in self.buttons:
                     if self.coord_in_extended_rect(self.mouse_pos, btn.coord, btn.size):
                         self.cube.move_queue.append(btn.label)
+                if evt.button == 1 and self.cube_rect.collidepoint(evt.pos):
+                    facelet = self.pick_facelet(evt.pos)
+                    self.drag = None if facelet is None else (facelet, evt.pos)
+            if evt.type == pg.MOUSEMOTION and self.drag:
+                facelet, start = self.drag
+                if abs(evt.pos[0] - start[0]) + abs(evt.pos[1] - start[1]) >= self.drag_dist:
+                    self.cube.move_queue.append(self.drag_move(facelet, start, evt.pos))
+                    self.drag = None
+            if evt.type == pg.MOUSEBUTTONUP:
+                self.drag = None
+
+    def pick_facelet(self, pos):
+        """Index of the facelet drawn at a screen position, or None"""
+        view = self.get_view()
+        cube = self.cube
+        key = (view, cube.move_code, cube.move_curr_rot) if cube.is_moving else (view, )
+        if key != self.pick_key:
+            self.pick_layer.surface.fill((0, 0, 0))
+            self.draw_cube(self.pick_layer.pen, self.pick_cols)
+            self.pick_key = key
+
+        r, g, b, _ = self.pick_layer.surface.get_at(pos)
+        i = r << 16 | g << 8 | b
+        return i - 1 if i else None
+
+    def drag_move(self, facelet, start, end):
+        """
+        Move code turning the layer that moves a facelet in the direction of a mouse drag
+
+        The drag is matched to whichever of the two axes along the sticker's
+        face it is closest to on screen. The layer turned is the one at the
+        sticker, around the third axis.
+        """
+        view = self.get_view()
+        size = self.cube.size
+        centres = self.cube.facelet_centres
+        centre = centres[facelet]
+        axis = facelet // (size * size) // 2
+        drag = (end[0] - start[0], end[1] - start[1])
+
+        # Screen direction of each axis along the face, at the sticker
+        origin = view.project_point(centre)
+        best = None
+        for along in other_axes(axis):
+            point = list(centre)
+            point[along] += 1
+            x, y = view.project_point(point)
+            direction = (x - origin[0], y - origin[1])
+            dot = drag[0] * direction[0] + drag[1] * direction[1]
+            score = abs(dot) / max(1e-9, (direction[0] ** 2 + direction[1] ** 2) ** 0.5)
+            if best is None or score > best[0]:
+                best = (score, along, 1 if dot > 0 else -1)
+        _, along, sign = best
+
+        # Layer of the sticker along the turn axis (from the facelet index, see state.facelet_index)
+        turn_axis = 3 - axis - along
+        a, _ = other_axes(axis)
+        rem = facelet % (size * size)
+        layer = rem // size if turn_axis == a else rem % size
+
+        # A quarter turn one way moves the sticker along +along, the other way along -along
+        dest = move_perm(size, turn_axis, (layer, ), 1).index(facelet)
+        moved = centres[dest][along] - centre[along]
+        return encode(turn_axis, (layer, ), 1 if moved * sign > 0 else 3)
 
     def render(self):
-        self.draw_cube()
-        self.draw_gui()
-        self.draw_mouse()
+        """Redraw the parts of the screen that changed, returning their rects"""
+        dirty = []
+
+        view = self.get_view()
+        if self.cube.changed or view is not self.cube_layer_view:
+            self.draw_cube_layer(view)
+            dirty.append(self.cube_rect)
+
+        dirty.extend(self.draw_gui())
+
+        pointer_rect = None
+        if pg.mouse.get_focused():
+            pointer_rect = self.pointer_img.get_rect(topleft=self.mouse_pos)
+        if pointer_rect != self.pointer_rect:
+            dirty.extend(rect for rect in (self.pointer_rect, pointer_rect) if rect is not None)
+            self.pointer_rect = pointer_rect
+
+        if self.full_redraw:
+            dirty = [self.screen.get_rect()]
+            self.full_redraw = False
+
+        # Composite the layers within each changed area
+        for rect in dirty:
+            self.screen.set_clip(rect)
+            self.cube_layer.blit(self.screen)
+            self.gui_layer.blit(self.screen)
+            self.draw_mouse()
+        self.screen.set_clip(None)
+
+        if self.profiler:
+            dirty.append(self.draw_overlay())
+        return dirty
+
+    def draw_overlay(self):
+        """Draw the frame time percentiles over the top right of the screen, returning the overlay rect"""
+        self.overlay_age += self.dt
+        if self.overlay_layer is None or self.overlay_age >= self.overlay_refresh:
+            self.overlay_age = 0
+            summary = self.profiler.summary()
+            line_height = self.overlay_font.font.get_linesize()
+            width = 230
+            self.overlay_layer = Layer((width, line_height * (len(summary) + 1) + 8), (self.width - width, 0))
+            surface = self.overlay_layer.surface
+            surface.fill(Color.D_Gray)
+
+            rows = [('ms', [f'p{pct}' for pct in self.profiler.PERCENTILES])]
+            rows += [(name, [f'{ms:.2f}' for ms in times]) for name, times in summary]
+            for i, (name, cols) in enumerate(rows):
+                y = 4 + i * line_height
+                self.overlay_font.render(name, 6, y, col=Color.White, surface=surface)
+                for j, text in enumerate(cols):
+                    self.overlay_font.render(text, 110 + 40 * (j + 1), y, col=Color.White, x_anchor='right', surface=surface)
+
+        self.overlay_layer.blit(self.screen)
+        return self.overlay_layer.surface.get_rect(topleft=self.overlay_layer.pos)
+
+    def draw_cube_layer(self, view):
+        self.cube_layer.surface.fill(self.BG_COL)
+        self.draw_cube(self.cube_layer.pen)
+        self.cube_layer_view = view
+        self.cube.changed = False
+
+    def get_view(self):
+        """Camera view transform - only rebuilt when the camera changes"""
+        centre = (self.width / 2 + self.gui_width // 2, self.height / 2)
+        key = (tuple(self.pos), self.yaw, self.pitch, self.projection_dist, centre)
+        if self.view is None or self.view.key != key:
+            self.view = ViewTransform(self.pos, self.yaw, self.pitch, self.projection_dist, centre)
+        return self.view
 
     def calc_coord(self, point):
-        # Transform so camera at origin
-        point = [val - self.pos[i] for i, val in enumerate(point)]
-
-        # Rotate so camera is facing down +z axis
-        point[0], point[2] = origin_rotate(point[0], point[2], -self.yaw)
-        point[1], point[2] = origin_rotate(point[1], point[2], -self.pitch)
-
-        # Ensure point is visible
-        assert point[2] > 0, 'Vertex is located behind camera view!'
-        
-        # Scale factor to project point onto projection plane
-        scale = self.projection_dist / point[2]
-
-        # Resulting screen coodinate
-        res = [point[0] * scale, point[1] * scale]
-
-        # Transform so that (0, 0) is centre of screen
-        res[0] += self.width / 2
-        res[1] += self.height / 2
-
-        return res
-
-    def draw_cube(self):
-        def dist_from_camera(tri):
-            """Distance from centre of triangle to camera position"""
-
-            # Transform so camera at origin
-            tri = [[(point[i] - self.pos[i]) for i in range(3)] for point in tri]
-            # Get centre (average coordinate) - skip middle coordinate
-            centre = [(tri[0][i] + tri[1][i]) / 2 for i in range(3)]
-            # Calculate distance
-            dist = sqrt(centre[0] ** 2 + centre[1] ** 2 + centre[2] ** 2)
-
-            return dist
-
-        render_tris = []
-
-        # Get all tris to be rendered
-        for plane in self.cube.blocks:
-            for row in plane:
-                for block in row:
-                    for axis in block.tris:
-                        for side in axis:
-                            for tri in side:
-                                render_tris.append(tri)
-
-        # Sort according to depth
-        render_tris.sort(key=lambda tri: dist_from_camera(tri.coords), reverse=True)
-
-        # Render all tris
-        for tri in render_tris:
-            points = [self.calc_coord(point) for point in tri.coords]
-            for point in points:
-                point[0] += self.gui_width // 2
+        return self.get_view().project_point(point)
+
+    def draw_cube(self, pen=None, tri_cols=None):
+        """Draw the cube - with tri_cols (an RGB color per tri), stickers are filled with those and the rest black"""
+        pen = pen or self.pen
+        view = self.get_view()
+
+        # Transform all vertices at once
+        cam_verts = view.transform(self.cube.verts)
+        screen_verts = view.project(cam_verts)
+
+        # Interior faces can only be seen while a layer is turning
+        # Otherwise the gaps between blocks are filled by drawing the outer faces of the whole cube first
+        cull_interior = not self.cube.is_moving
+        if cull_interior:
+            self.draw_cube_hull(view, pen, None if tri_cols is None else (0, 0, 0))
+
+        # Skip faces pointing away from the camera
+        visible = []
+        for tri_ids, face_diag, block_diag, interior in self.cube.faces:
+            if cull_interior and interior:
+                continue
+            if is_front_facing(cam_verts, face_diag, block_diag):
+                visible.extend(tri_ids)
+
+        # Render visible tris, sorted according to depth
+        tris = self.cube.tris
+        tri_indices = self.cube.tri_indices
+        for i in depth_order(cam_verts, [tri_indices[i] for i in visible]):
+            tri = tris[visible[i]]
+            points = [screen_verts[v] for v in tri.indices]
             # self.pen.draw_polygon(points, width=1) # Draw triangle - debugging only
-            self.pen.draw_polygon(points, col=tri.col.rgb_vals())
+            pen.draw_polygon(points, col=tri.col.rgb_vals() if tri_cols is None else tri_cols[visible[i]])
+
+    def draw_cube_hull(self, view, pen, col=None):
+        """Draw the outer faces of the whole cube that face the camera"""
+        col = col or Block.INTERIOR_COL.rgb_vals()
+        for quad in self.cube.hull_faces:
+            # Quad corners plus cube centre (origin), with the face diagonal at index 0, 2
+            cam_verts = view.transform(quad + [(0, 0, 0)])
+            if is_front_facing(cam_verts, (0, 2), (4, 4)):
+                pen.draw_polygon(view.project(cam_verts[:4]), col=col)
+
+    def gui_state(self):
+        """(Hovered button index or None, mouse pressed) - the only GUI state that changes between frames"""
+        for i, btn in enumerate(self.buttons):
+            if self.coord_in_extended_rect(self.mouse_pos, btn.coord, btn.size):
+                return i, pg.mouse.get_pressed()[0]
+        return None, False
 
     def draw_gui(self):
+        """Redraw the GUI panel if its state changed, returning the changed rects"""
+        state = self.gui_state()
+        if state == self.gui_layer_state:
+            return []
+
+        prev_state, self.gui_layer_state = self.gui_layer_state, state
+        self.draw_gui_panel(*state)
+        if prev_state is None:
+            return [self.gui_rect]
+
+        # Only the previously and newly hovered buttons change
+        hovered = {i for i, _ in (prev_state, state) if i is not None}
+        return [self.button_rect(self.buttons[i]) for i in hovered]
+
+    def button_rect(self, btn):
+        return pg.Rect(btn.coord, btn.size).inflate(2, 2)
+
+    def draw_gui_panel(self, hovered, pressed):
+        pen = self.gui_layer.pen
+        surface = self.gui_layer.surface
+
         # Background
-        self.pen.draw_rect((0, 0), (self.gui_width, self.height), col=self.gui_bg_col)
+        pen.draw_rect((0, 0), (self.gui_width, self.height), col=self.gui_bg_col)
 
         # Title
-        self.pen.draw_rect((0, 0), (self.gui_width, self.gui_row_height), col=self.gui_title_col)
-        self.gui_font.render('Rubik\'s Cube 3D', self.gui_width // 2, self.gui_row_height // 2, x_anchor='center', y_anchor='center', col=Color.White)
+        pen.draw_rect((0, 0), (self.gui_width, self.gui_row_height), col=self.gui_title_col)
+        self.gui_font.render('Rubik\'s Cube 3D', self.gui_width // 2, self.gui_row_height // 2, x_anchor='center', y_anchor='center', col=Color.White, surface=surface)
 
         # Buttons
-        for btn in self.buttons:
+        for i, btn in enumerate(self.buttons):
             col = btn.default_col
-            if self.coord_in_extended_rect(self.mouse_pos, btn.coord, btn.size):
+            if i == hovered:
                 col = (200, ) * 3
-                if pg.mouse.get_pressed()[0]:
+                if pressed:
                     col = (180, ) * 3
 
-            self.pen.draw_rect(btn.coord, btn.size, col=col)
+            pen.draw_rect(btn.coord, btn.size, col=col)
             mid_x = btn.coord[0] + btn.size[0] / 2
             mid_y = btn.coord[1] + btn.size[1] / 2
-            self.gui_font.render(btn.label, mid_x, mid_y, x_anchor='center', y_anchor='center')
+            self.gui_font.render(btn.label, mid_x, mid_y, x_anchor='center', y_anchor='center', surface=surface)
 
     def coord_in_extended_rect(self, coord, rect_from, size):
         """Check if coordinate is within an extended rectangle"""
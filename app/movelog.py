@@ -0,0 +1,374 @@
+"""
+Compact binary move logs: streaming recorder and replay
+
+A log is an append-only file:
+
+    header: b'RBXL', version, cube size, tick (ms), start time (epoch seconds, float64)
+    then a stream of events, each starting with one byte:
+
+        top 2 bits: 0 = same time as the previous event
+                    1 = time delta follows (varint, in ticks)
+        low 6 bits: 0-61 = move symbol
+                    62   = new move (varint move code follows, see app.sequence)
+                    63   = checkpoint (top bits 0): varint move number,
+                           varint time (ticks since start), packed state
+
+Move symbols are assigned to move codes in order of first use, and the
+table restarts at every checkpoint, so decoding can start at any
+checkpoint. A move costs one byte, plus (usually) one byte of time delta
+when moves are made interactively rather than in bursts.
+
+Checkpoints hold the full cube state and are written every
+checkpoint_interval moves. Their file offsets are also appended to an
+index file next to the log (<log>.idx), so seeking to a move only decodes
+from the nearest checkpoint before it. Without the index, the log is
+scanned for checkpoints instead.
+"""
+
+import os
+import struct
+import time
+from bisect import bisect_right
+from itertools import chain
+
+from app.state import CubeState
+from app.sequence import decode
+
+MAGIC = b'RBXL'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBd')
+INDEX_ENTRY = struct.Struct('<QQ') # Move number, file offset of the checkpoint
+
+TIMED = 0x40
+NEW_SYMBOL = 62
+CHECKPOINT = 63
+MAX_SYMBOLS = 62
+
+def write_varint(buf, value):
+    while value >= 0x80:
+        buf.append(value & 0x7f | 0x80)
+        value >>= 7
+    buf.append(value)
+
+def read_varint(data, pos):
+    """(value, position after it)"""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def _state_bytes(size):
+    return (18 * size * size + 7) // 8
+
+class MoveRecorder:
+    """
+    Streams moves (as move codes) to a log
+
+    The recorder tracks the cube state itself (starting from state, or
+    solved), so checkpoints need nothing from the caller. Appending to an
+    existing log starts with a checkpoint of the current state, after
+    cutting off any event left incomplete at its end (eg. by a crash).
+
+    Times within a session are measured with clock (monotonic, so event
+    deltas never go backwards if the system time is changed), from the
+    wall_clock time the session started at.
+    """
+
+    TICK_MS = 10
+    CHECKPOINT_INTERVAL = 1000
+
+    def __init__(self, path, size=3, state=None, checkpoint_interval=CHECKPOINT_INTERVAL, clock=time.monotonic, wall_clock=time.time):
+        self.size = size
+        self.state = state.copy() if state is not None else CubeState(size)
+        self.checkpoint_interval = checkpoint_interval
+        self.clock = clock
+
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER.size:
+            log = MoveLog(path)
+            assert log.size == size, 'Log recorded for a different cube size'
+            self.tick_ms, self.start = round(log.tick * 1000), log.start_time
+            self.moves = len(log) # Move numbers continue from the existing log
+            self._truncate(path, log)
+        elif os.path.exists(path):
+            os.truncate(path, 0) # Not even a whole header
+
+        self.file = open(path, 'ab')
+        self.index = open(path + '.idx', 'ab')
+        if self.file.tell() == 0:
+            self.tick_ms = self.TICK_MS
+            self.start = wall_clock()
+            self.file.write(HEADER.pack(MAGIC, VERSION, size, self.tick_ms, self.start))
+            self.moves = 0
+            self.index.truncate(0)
+
+        self.session_moves = 0
+        self.session_ticks = max(0, int((wall_clock() - self.start) * 1000 / self.tick_ms))
+        self.session_clock = clock()
+        self.last_ticks = None
+        self.checkpoint()
+
+    @staticmethod
+    def _truncate(path, log):
+        """Cut a log back to its last complete event, and its index to the checkpoints before that"""
+        end = log.valid_length()
+        if end < len(log.data):
+            os.truncate(path, end)
+        with open(path + '.idx', 'wb') as index:
+            index.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in log.checkpoints if entry[1] < end))
+
+    def _ticks(self):
+        return self.session_ticks + int((self.clock() - self.session_clock) * 1000 / self.tick_ms)
+
+    def checkpoint(self):
+        """Write the current state, and restart the move symbol table"""
+        self.symbols = {}
+        self.last_ticks = self._ticks()
+
+        buf = bytearray([CHECKPOINT])
+        write_varint(buf, self.moves)
+        write_varint(buf, self.last_ticks)
+        buf += self.state.pack().to_bytes(_state_bytes(self.size), 'little')
+
+        self.index.write(INDEX_ENTRY.pack(self.moves, self.file.tell()))
+        self.file.write(buf)
+        self.file.flush()
+        self.index.flush()
+
+    def record(self, code):
+        """Record a move code applied to the cube"""
+        if self.session_moves and self.session_moves % self.checkpoint_interval == 0:
+            self.checkpoint()
+
+        buf = bytearray(1)
+        ticks = self._ticks()
+        if ticks != self.last_ticks:
+            buf[0] = TIMED
+            write_varint(buf, ticks - self.last_ticks)
+            self.last_ticks = ticks
+
+        symbol = self.symbols.get(code)
+        if symbol is None:
+            if len(self.symbols) < MAX_SYMBOLS:
+                self.symbols[code] = len(self.symbols)
+            symbol = NEW_SYMBOL
+            write_varint(buf, code)
+        buf[0] |= symbol
+        self.file.write(buf)
+        self.file.flush() # A killed session keeps every move recorded before it
+
+        self.state.apply_turn(*decode(code))
+        self.moves += 1
+        self.session_moves += 1
+
+    def flush(self):
+        self.file.flush()
+        self.index.flush()
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+def read_header(data):
+    magic, version, size, tick, start = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a move log')
+    if version != VERSION:
+        raise ValueError(f'Unsupported move log version {version}')
+    return {'version': version, 'size': size, 'tick': tick, 'start': start}
+
+class MoveLog:
+    """
+    Read access to a recorded log
+
+    The log is read into memory once (it is compact, at about a byte per
+    move). Checkpoints written by later sessions appended to the log reset
+    the state, so replaying a log always reproduces the recorded states.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        header = read_header(self.data)
+        self.size = header['size']
+        self.tick = header['tick'] / 1000
+        self.start_time = header['start']
+        self.checkpoints = self._load_index(path + '.idx')
+
+    def _load_index(self, index_path):
+        """[(move number, offset)] of every checkpoint, from the index file (or by scanning the log)"""
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                index = f.read()
+            entries = [INDEX_ENTRY.unpack_from(index, i) for i in range(0, len(index) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size)]
+            if entries and all(offset < len(self.data) and self.data[offset] == CHECKPOINT for _, offset in entries):
+                return entries
+        return [(value[0], offset) for kind, offset, value in self._events(HEADER.size) if kind == CHECKPOINT]
+
+    def _events(self, pos):
+        """
+        Raw events from an offset: (CHECKPOINT, offset, (move, ticks, state)) or (None, offset, (ticks, code))
+
+        Returns the offset decoding stopped at: the end of the log, or the
+        start of an event cut off there.
+        """
+        data, size = self.data, self.size
+        state_bytes = _state_bytes(size)
+        symbols = []
+        ticks = 0
+        while pos < len(data):
+            offset = pos
+            try:
+                byte = data[pos]
+                pos += 1
+                symbol = byte & 0x3f
+
+                if symbol == CHECKPOINT:
+                    move, pos = read_varint(data, pos)
+                    ticks, pos = read_varint(data, pos)
+                    if pos + state_bytes > len(data):
+                        return offset
+                    packed = int.from_bytes(data[pos:pos + state_bytes], 'little')
+                    pos += state_bytes
+                    symbols = []
+                    yield CHECKPOINT, offset, (move, ticks, CubeState.unpack(size, packed))
+                    continue
+
+                if byte & TIMED:
+                    delta, pos = read_varint(data, pos)
+                    ticks += delta
+                if symbol == NEW_SYMBOL:
+                    code, pos = read_varint(data, pos)
+                    if len(symbols) < MAX_SYMBOLS:
+                        symbols.append(code)
+                else:
+                    code = symbols[symbol]
+            except IndexError: # Event cut off at the end of the log (eg. the recorder was killed)
+                return offset
+            yield None, offset, (ticks, code)
+        return pos
+
+    def seek(self, move=0):
+        """
+        (state before the given move number, generator of the events from it)
+
+        Decoding starts at the nearest checkpoint at or before the move.
+        Events are (move number, seconds since the log started, move code),
+        or (move number, seconds, CubeState) where a checkpoint resets the
+        state (a later session, or Cube.set_state while recording).
+        """
+        i = bisect_right([number for number, _ in self.checkpoints], move) - 1
+        if i < 0:
+            raise ValueError('Log has no checkpoint')
+
+        events = self._events(self.checkpoints[i][1])
+        for kind, _, value in events:
+            if kind == CHECKPOINT:
+                number, _, state = value
+                continue
+            if number == move:
+                return state, self._moves(number, state.copy(), value, events)
+            state.apply_turn(*decode(value[1]))
+            number += 1
+        return state, iter(())
+
+    def _moves(self, number, state, first, events):
+        """Events from the first move, tracking the state so checkpoints that only repeat it are skipped"""
+        tick = self.tick
+        for kind, _, value in chain([(None, None, first)], events):
+            if kind == CHECKPOINT:
+                number, ticks, checkpoint = value
+                if checkpoint != state:
+                    state = checkpoint
+                    yield number, ticks * tick, state.copy()
+            else:
+                ticks, code = value
+                yield number, ticks * tick, code
+                state.apply_turn(*decode(code))
+                number += 1
+
+    def events(self, start=0):
+        """Generator of the events from a move number (see seek)"""
+        return self.seek(start)[1]
+
+    def state_at(self, move):
+        """State before the given move number"""
+        return self.seek(move)[0]
+
+    def final_state(self):
+        """Replay the whole log headlessly, at full speed"""
+        return self.seek(float('inf'))[0]
+
+    def valid_length(self):
+        """Length of the log up to the end of its last complete event"""
+        events = self._events(self.checkpoints[-1][1] if self.checkpoints else HEADER.size)
+        while True:
+            try:
+                next(events)
+            except StopIteration as stop:
+                return stop.value
+
+    def __len__(self):
+        """Number of moves in the log"""
+        if not self.checkpoints:
+            return 0
+        number, offset = self.checkpoints[-1]
+        return number + sum(1 for kind, _, _ in self._events(offset) if kind is None)
+
+MAX_GAP = 2.0
+
+def close_gaps(events, max_gap=MAX_GAP):
+    """
+    Events with their times changed so no two are more than max_gap seconds apart
+
+    Times are otherwise kept from the start of the log, so playback would
+    wait out the time between sessions appended to it (or a long break).
+    Times that go back (a session started with the system clock behind)
+    are treated as no gap.
+    """
+    last = time = None
+    for number, event_time, item in events:
+        if last is None:
+            time = event_time
+        else:
+            time += min(max(event_time - last, 0), max_gap)
+        last = event_time
+        yield number, time, item
+
+class Replayer:
+    """
+    Streams a log into an animated Cube, keeping to the recorded timing
+
+    The cube is first set to the state at the start move. Moves are queued
+    (and state resets applied) as their (scaled) recorded time comes round,
+    with gaps longer than max_gap seconds (eg. between sessions) shortened
+    to it; call update(dt) every frame.
+    """
+
+    def __init__(self, log, cube, start=0, speed=1.0, max_gap=MAX_GAP):
+        assert log.size == cube.size, 'Log recorded for a different cube size'
+        self.log = log
+        self.cube = cube
+        self.speed = speed
+
+        state, events = log.seek(start)
+        self._events = close_gaps(events, max_gap)
+        cube.set_state(state)
+
+        self._next = next(self._events, None)
+        self.elapsed = self._next[1] if self._next else 0
+        self.finished = self._next is None
+
+    def update(self, dt):
+        self.elapsed += dt * self.speed
+        while self._next is not None and self._next[1] <= self.elapsed:
+            item = self._next[2]
+            if isinstance(item, CubeState):
+                self.cube.set_state(item)
+            else:
+                self.cube.move_queue.append(item)
+            self._next = next(self._events, None)
+        self.finished = self._next is None
@@ -0,0 +1,147 @@
+"""
+Frame time profiler
+
+Timing spans are added by wrapping functions when the profiler is installed
+(see Profiler.instrument) and removed again on uninstall, so a disabled
+profiler adds no code to the hot paths at all.
+
+Each frame's spans are summed per name into a rolling window, from which
+percentile summaries are taken (eg. for an on-screen overlay), and can be
+passed to exporters that write per-frame traces to a file.
+"""
+
+import json
+from collections import deque
+from functools import wraps
+from time import perf_counter
+
+def percentile(sorted_values, pct):
+    """Nearest rank percentile of a sorted list"""
+    if not sorted_values:
+        return 0
+    rank = max(1, -(-len(sorted_values) * pct // 100)) # Ceiling division
+    return sorted_values[int(rank) - 1]
+
+class Profiler:
+    WINDOW = 120 # Frames in the rolling window
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, window=WINDOW, exporters=()):
+        self.spans = [] # (name, start, end) of every span this frame
+        self.history = deque(maxlen=window) # (frame time, {name: total span time}) per frame
+        self.exporters = list(exporters)
+        self.names = [] # Span names in the order they were instrumented
+        self.frame_count = 0
+        self.frame_start = perf_counter()
+        self._hooks = [] # (owner, attribute name, original function)
+
+    def instrument(self, owner, attr, name):
+        """Record a span around every call to owner.attr (a class or module attribute)"""
+        func = getattr(owner, attr)
+        spans = self.spans
+        clock = perf_counter
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                spans.append((name, start, clock()))
+
+        # Only attributes defined on the owner itself are restored (inherited ones are deleted)
+        self._hooks.append((owner, attr, owner.__dict__.get(attr)))
+        setattr(owner, attr, timed)
+        if name not in self.names:
+            self.names.append(name)
+
+    def uninstall(self):
+        """Remove every instrumented span and close the exporters"""
+        for owner, attr, original in reversed(self._hooks):
+            if original is None:
+                delattr(owner, attr)
+            else:
+                setattr(owner, attr, original)
+        self._hooks.clear()
+
+        for exporter in self.exporters:
+            exporter.close()
+        self.exporters.clear()
+
+    def start_frame(self):
+        self.frame_start = perf_counter()
+
+    def end_frame(self):
+        """Close the current frame, recording its spans"""
+        end = perf_counter()
+        totals = dict.fromkeys(self.names, 0)
+        for name, start, stop in self.spans:
+            totals[name] += stop - start
+        self.history.append((end - self.frame_start, totals))
+
+        for exporter in self.exporters:
+            exporter.export(self.frame_count, self.frame_start, end, self.spans)
+
+        self.spans.clear()
+        self.frame_count += 1
+
+    def summary(self):
+        """[(name, (percentiles in ms))] over the rolling window, for the whole frame and then each span"""
+        rows = [('frame', sorted(frame for frame, _ in self.history))]
+        for name in self.names:
+            rows.append((name, sorted(totals.get(name, 0) for _, totals in self.history)))
+        return [(name, tuple(percentile(values, pct) * 1000 for pct in self.PERCENTILES)) for name, values in rows]
+
+class TraceExporter:
+    """Base class for per-frame trace writers"""
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.origin = None # Timestamps are written relative to the first frame
+
+    def export(self, frame, start, end, spans):
+        if self.origin is None:
+            self.origin = start
+        self.write(frame, start - self.origin, end - self.origin, [(name, s - self.origin, e - self.origin) for name, s, e in spans])
+
+    def write(self, frame, start, end, spans):
+        """Write one frame - times in seconds since the first frame"""
+        raise NotImplementedError('The write method must be overridden')
+
+    def close(self):
+        self.file.close()
+
+class JsonLinesExporter(TraceExporter):
+    """One JSON object per frame: {"frame", "start", "ms", "spans": {name: [total ms, calls]}}"""
+
+    def write(self, frame, start, end, spans):
+        totals = {}
+        for name, s, e in spans:
+            total = totals.setdefault(name, [0, 0])
+            total[0] += (e - s) * 1000
+            total[1] += 1
+        self.file.write(json.dumps({'frame': frame, 'start': start, 'ms': (end - start) * 1000, 'spans': totals}) + '\n')
+
+class ChromeTraceExporter(TraceExporter):
+    """Trace Event Format (chrome://tracing, Perfetto) - each frame and span as a complete event"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file.write('[')
+        self.first = True
+
+    def event(self, name, start, end, **args):
+        event = {'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': (end - start) * 1e6, 'pid': 0, 'tid': 0}
+        if args:
+            event['args'] = args
+        self.file.write(('\n' if self.first else ',\n') + json.dumps(event))
+        self.first = False
+
+    def write(self, frame, start, end, spans):
+        self.event('frame', start, end, frame=frame)
+        for name, s, e in spans:
+            self.event(name, s, e)
+
+    def close(self):
+        self.file.write('\n]\n')
+        super().close()
@@ -0,0 +1,83 @@
+"""Batched camera transform and perspective projection of vertex buffers"""
+
+from app.trig import rotation
+
+class ViewTransform:
+    """
+    Camera view matrix, built once per camera change
+
+    Equivalent to translating so the camera is at the origin, then rotating
+    by -yaw around the y axis and by -pitch around the x axis so the camera
+    faces down the +z axis.
+    """
+
+    def __init__(self, pos, yaw, pitch, projection_dist, centre):
+        self.key = (tuple(pos), yaw, pitch, projection_dist, tuple(centre))
+
+        yaw_rot, pitch_rot = rotation(yaw), rotation(pitch)
+        sin_y, cos_y = yaw_rot.sin, yaw_rot.cos
+        sin_p, cos_p = pitch_rot.sin, pitch_rot.cos
+
+        # Rotation matrix rows
+        self.rows = (
+            (cos_y, 0, -sin_y),
+            (-sin_p * sin_y, cos_p, -sin_p * cos_y),
+            (cos_p * sin_y, sin_p, cos_p * cos_y),
+        )
+        # Translation folded into the matrix (rotated camera position)
+        self.offset = tuple(-sum(row[i] * pos[i] for i in range(3)) for row in self.rows)
+
+        self.projection_dist = projection_dist
+        self.centre = tuple(centre)
+
+    def transform(self, verts):
+        """Camera space coordinates of every vertex"""
+        (a0, a1, a2), (b0, b1, b2), (c0, c1, c2) = self.rows
+        ox, oy, oz = self.offset
+        return [
+            (a0 * x + a1 * y + a2 * z + ox, b0 * x + b1 * y + b2 * z + oy, c0 * x + c1 * y + c2 * z + oz)
+            for x, y, z in verts
+        ]
+
+    def project(self, cam_verts):
+        """Screen coordinates of camera space vertices (all must be in front of the camera)"""
+        dist = self.projection_dist
+        cx, cy = self.centre
+        return [(x * dist / z + cx, y * dist / z + cy) for x, y, z in cam_verts]
+
+    def project_point(self, point):
+        """Screen coordinate of a single world space point"""
+        cam = self.transform([point])[0]
+        assert cam[2] > 0, 'Vertex is located behind camera view!'
+        return list(self.project([cam])[0])
+
+def depth_order(cam_verts, tri_indices):
+    """
+    Painter's algorithm draw order (furthest first) of tris given as vertex index triples
+
+    Depth is measured to the midpoint of each tri's first two vertices, which
+    is the centre of the face the tri belongs to.
+    """
+    depths = []
+    for i0, i1, _ in tri_indices:
+        x0, y0, z0 = cam_verts[i0]
+        x1, y1, z1 = cam_verts[i1]
+        x, y, z = x0 + x1, y0 + y1, z0 + z1
+        depths.append(x * x + y * y + z * z)
+    return sorted(range(len(depths)), key=depths.__getitem__, reverse=True)
+
+def is_front_facing(cam_verts, face_diag, body_diag):
+    """
+    Whether a face of a convex body faces the camera
+
+    Takes camera space vertices and the vertex indices of a diagonal of the
+    face and of the body. The outward normal runs from the body centre to
+    the face centre.
+    """
+    f0, f1 = cam_verts[face_diag[0]], cam_verts[face_diag[1]]
+    b0, b1 = cam_verts[body_diag[0]], cam_verts[body_diag[1]]
+    dot = 0
+    for i in range(3):
+        centre = f0[i] + f1[i]
+        dot += (centre - b0[i] - b1[i]) * centre
+    return dot < 0
@@ -0,0 +1,139 @@
+"""
+Random state scrambles
+
+Rather than turning random faces (which needs very long sequences before
+positions are anywhere near uniformly distributed), a uniformly random valid
+position is sampled directly and a move sequence reaching it is found:
+
+3x3: random corner / edge permutations (with matching parity) and
+     orientations (summing to zero), solved with the two-phase solver -
+     the inverse of the solution is the scramble
+2x2: a uniformly random position number (see app.statespace), walked back
+     to solved with the distance table, so 2x2 scrambles are optimal
+
+Scrambles are reproducible: scramble i of a batch only depends on the seed
+and i, however the batch is split between processes.
+
+Usage: python -m app.scramble [-n count] [--size 3] [--seed S] [-j processes]
+"""
+
+import argparse
+import random
+import sys
+from multiprocessing import Pool, cpu_count
+
+INVERSE_SUFFIX = {'': '\'', '\'': '', '2': '2'}
+
+def invert_moves(moves):
+    return [move[0] + INVERSE_SUFFIX[move[1:]] for move in reversed(moves)]
+
+def random_cubie(rng=random):
+    """Uniformly random valid 3x3 solver.CubieCube"""
+    from app.solver import CubieCube, _parity
+
+    cp = list(range(8))
+    ep = list(range(12))
+    rng.shuffle(cp)
+    rng.shuffle(ep)
+    if _parity(cp) != _parity(ep):
+        ep[0], ep[1] = ep[1], ep[0]
+
+    co = [rng.randrange(3) for _ in range(7)]
+    co.append(-sum(co) % 3)
+    eo = [rng.randrange(2) for _ in range(11)]
+    eo.append(sum(eo) % 2)
+    return CubieCube(cp, co, ep, eo)
+
+def random_state(size=3, rng=random):
+    """Uniformly random valid CubeState (2x2 or 3x3)"""
+    if size == 2:
+        from app import statespace
+        return statespace.index_state(rng.randrange(statespace.N_2X2))
+    if size == 3:
+        return random_cubie(rng).to_state()
+    raise ValueError(f'Random state scrambles are only available for 2x2 and 3x3 cubes, not {size}x{size}')
+
+def _solve_2x2(state):
+    """Optimal solution of a 2x2 state, following the distance table down to 0"""
+    from app import statespace
+    table = statespace.distance_table()
+    solution = []
+    dist = statespace.distance(state, table)
+    while dist:
+        for move in statespace.MOVES_2X2:
+            next_state = state.copy()
+            next_state.apply(move)
+            next_dist = statespace.distance(next_state, table)
+            if next_dist < dist:
+                solution.append(move)
+                state, dist = next_state, next_dist
+                break
+    return solution
+
+def scramble(size=3, rng=random, max_length=24):
+    """
+    Moves taking a solved cube to a uniformly random position
+
+    Returns None if the solver gave up within max_length. The position is
+    never redrawn (positions the solver finds hard would then be under
+    represented), so callers should report the failure or use a larger
+    max_length.
+    """
+    state = random_state(size, rng)
+    if size == 2:
+        return invert_moves(_solve_2x2(state))
+    from app import solver
+    solution = solver.solve(state, max_length)
+    return invert_moves(solution) if solution is not None else None
+
+def _scramble_i(args):
+    seed, i, size, max_length = args
+    return scramble(size, random.Random(f'{seed}:{i}'), max_length)
+
+def _init_worker(size):
+    # Open the memory mapped tables once per worker
+    if size == 2:
+        from app import statespace
+        statespace.distance_table()
+    else:
+        from app import solver
+        solver.get_tables()
+
+def scrambles(count, size=3, seed=None, max_length=24, processes=1, chunk_size=16):
+    """
+    Generator of count scrambles (lists of moves, or None where scramble gave up)
+
+    With a seed, the same scrambles are produced every time (whatever the
+    number of processes). processes=None uses every CPU.
+    """
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+    jobs = ((seed, i, size, max_length) for i in range(count))
+    if processes is None:
+        processes = cpu_count()
+
+    if processes <= 1:
+        _init_worker(size)
+        yield from map(_scramble_i, jobs)
+        return
+
+    with Pool(processes, initializer=_init_worker, initargs=(size, )) as pool:
+        yield from pool.imap(_scramble_i, jobs, chunk_size)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate uniformly random state scrambles, one per line')
+    parser.add_argument('-n', '--count', type=int, default=1, help='number of scrambles')
+    parser.add_argument('--size', type=int, default=3, choices=(2, 3), help='cube size')
+    parser.add_argument('--seed', help='seed, for reproducible scrambles')
+    parser.add_argument('--max-length', type=int, default=24, help='maximum 3x3 scramble length')
+    parser.add_argument('-j', '--processes', type=int, default=1, help='worker processes (0: CPU count)')
+    args = parser.parse_args(argv)
+
+    for i, moves in enumerate(scrambles(args.count, args.size, args.seed, args.max_length, args.processes or None)):
+        if moves is None:
+            print(f'No scramble found for position {i} within {args.max_length} moves (try a larger --max-length)', file=sys.stderr)
+            sys.exit(1)
+        sys.stdout.write(' '.join(moves) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Move sequence compiler
+
+Move strings are parsed once into compact integer move codes:
+
+    code = layer mask << 4 | axis << 2 | clockwise quarter turns
+
+Adjacent moves on the same axis commute, so each run of them is merged into
+the net turn of every layer (cancelling moves like R R' or R L R' entirely).
+A compiled sequence can also be precomposed into a single facelet
+permutation, so applying it headlessly costs one permutation.
+"""
+
+from collections import deque
+from functools import lru_cache
+from operator import itemgetter
+
+from app.state import FACE_MOVES, SLICE_MOVES, move_perm, parse_move
+
+def encode(axis, layers, turns):
+    mask = 0
+    for layer in layers:
+        mask |= 1 << layer
+    return mask << 4 | axis << 2 | turns % 4
+
+@lru_cache(maxsize=None)
+def decode(code):
+    """(axis, layers, turns) of a move code"""
+    mask = code >> 4
+    layers = tuple(i for i in range(mask.bit_length()) if mask >> i & 1)
+    return code >> 2 & 3, layers, code & 3
+
+def code_axis(code):
+    return code >> 2 & 3
+
+@lru_cache(maxsize=4096)
+def parse_code(move, size=3):
+    return encode(*parse_move(move, size))
+
+def parse(moves, size=3):
+    """Move codes of a sequence (a whitespace separated string, or an iterable of move strings / codes)"""
+    if isinstance(moves, str):
+        moves = moves.split()
+    return [move if isinstance(move, int) else parse_code(move, size) for move in moves]
+
+def merge_tail(codes, code):
+    """
+    Merge a move code with the run of same axis moves at the end of a list
+    (or deque) of codes
+
+    The run is popped off the end of codes, and the codes replacing it and
+    the new move are returned.
+    """
+    axis = code_axis(code)
+    if not codes or code_axis(codes[-1]) != axis:
+        return [code] if code & 3 else []
+
+    # Net turns of each layer over the whole run
+    net = {}
+    while codes and code_axis(codes[-1]) == axis:
+        _, layers, turns = decode(codes.pop())
+        for layer in layers:
+            net[layer] = (net.get(layer, 0) + turns) % 4
+    _, layers, turns = decode(code)
+    for layer in layers:
+        net[layer] = (net.get(layer, 0) + turns) % 4
+
+    # Layers with the same net turns are turned together
+    merged = []
+    for turns in (1, 2, 3):
+        layers = [layer for layer, layer_turns in net.items() if layer_turns == turns]
+        if layers:
+            merged.append(encode(axis, layers, turns))
+    return merged
+
+def compile_moves(moves, size=3):
+    """Parse a sequence into move codes, cancelling and merging same axis moves"""
+    codes = []
+    for code in parse(moves, size):
+        codes.extend(merge_tail(codes, code))
+    return codes
+
+def invert(codes):
+    return [code & ~3 | -code % 4 for code in reversed(codes)]
+
+def sequence_perm(codes, size=3):
+    """Single facelet permutation (gather form, see state.turn_perm) for a whole sequence"""
+    perm = list(range(6 * size * size))
+    for code in codes:
+        move = move_perm(size, *decode(code))
+        perm = [perm[i] for i in move]
+    return tuple(perm)
+
+def format_moves(codes, size=3):
+    """Move strings for a sequence of codes (layers with no shared notation are split into separate moves)"""
+    moves = []
+    suffixes = ('', '', '2', '\'')
+    for code in codes:
+        axis, layers, turns = decode(code)
+        suffix = suffixes[turns]
+        faces = [face for face, (face_axis, _) in FACE_MOVES.items() if face_axis == axis]
+
+        if size > 2 and layers == tuple(range(1, size - 1)):
+            slice_ = next(name for name, slice_axis in SLICE_MOVES.items() if slice_axis == axis)
+            moves.append(slice_ + suffix)
+            continue
+
+        # Wide turn from either face
+        count = len(layers)
+        if count > 1 and layers == tuple(range(count)):
+            moves.append(f'{count if count != 2 else ""}{faces[0]}w{suffix}')
+            continue
+        if count > 1 and layers == tuple(range(size - count, size)):
+            moves.append(f'{count if count != 2 else ""}{faces[1]}w{suffix}')
+            continue
+
+        # Single layers, counted from the nearest face
+        for layer in layers:
+            if layer < size - 1 - layer:
+                prefix, face = layer + 1, faces[0]
+            else:
+                prefix, face = size - layer, faces[1]
+            moves.append(f'{prefix if prefix > 1 else ""}{face}{suffix}')
+    return moves
+
+class CompiledSequence:
+    """A move sequence precomposed into one facelet permutation"""
+
+    def __init__(self, moves, size=3):
+        self.size = size
+        self.codes = compile_moves(moves, size)
+        self.perm = sequence_perm(self.codes, size)
+        self._getter = itemgetter(*self.perm)
+
+    def apply(self, state):
+        """Apply the whole sequence to a CubeState"""
+        assert state.size == self.size, 'Sequence compiled for a different cube size'
+        state.facelets[:] = self._getter(state.facelets)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __repr__(self):
+        return f'<CompiledSequence {" ".join(format_moves(self.codes, self.size))}>'
+
+class MoveQueue(deque):
+    """
+    Queue of pending move codes
+
+    Accepts move strings (eg. from the GUI buttons or a solver) or codes, and
+    merges each with the same axis moves queued before it.
+    """
+
+    def __init__(self, size=3, moves=()):
+        super().__init__()
+        self.size = size
+        self.extend(moves)
+
+    def append(self, move):
+        self.extend([move])
+
+    def extend(self, moves):
+        for code in parse(moves, self.size):
+            super().extend(merge_tail(self, code))
@@ -0,0 +1,576 @@
+"""
+Two-phase (Kociemba) solver for the 3x3 cube
+
+Phase 1 searches for a sequence reaching the subgroup G1 = <U, D, L2, R2, F2, B2>
+(all corner/edge orientations solved and the E-slice edges in the E-slice).
+Phase 2 then solves the cube using only G1 moves. Both phases are iterative
+deepening searches over coordinate move tables, bounded by pruning tables.
+The search keeps going after its first solution to look for shorter ones
+(near optimal), or can search for an optimal solution (see Search).
+Solutions are move strings in the same notation as Cube.move_queue.
+"""
+
+import time
+from functools import cached_property
+from itertools import combinations
+
+from app import tables
+from app.tables import nibble
+from app.state import CubeState, FACE_MOVES, facelet_index
+
+SIZE = 3
+
+# Moves: index = face * 3 + (quarter turns - 1), faces in FACE_MOVES order (face = axis * 2 + side)
+FACES = list(FACE_MOVES.keys())
+MOVE_NAMES = [face + suffix for face in FACES for suffix in ('', '2', '\'')]
+N_MOVES = len(MOVE_NAMES)
+
+# Phase 2 moves: any U/D turn, half turns of the other faces
+P2_MOVES = [m for m in range(N_MOVES) if FACE_MOVES[FACES[m // 3]][0] == 1 or m % 3 == 1]
+N_P2_MOVES = len(P2_MOVES)
+
+N_TWIST = 3 ** 7   # Corner orientations
+N_FLIP = 2 ** 11   # Edge orientations
+N_SLICE = 495      # Positions of the 4 E-slice edges (12 choose 4)
+N_PERM_8 = 40320   # Corner / U+D layer edge permutations (8!)
+N_PERM_4 = 24      # E-slice edge permutations (4!)
+
+UNKNOWN = 0xff
+
+def _gen_cubies():
+    """
+    Facelet indices of every corner and edge slot
+
+    Corner facelets start with the U/D (y axis) facelet, followed by the other
+    two in a consistent (right handed) order, so turns only ever cycle them.
+    Edge facelets start with the reference facelet used for edge orientation:
+    the U/D facelet if there is one, otherwise the F/B (z axis) facelet.
+    The four E-slice (y == 1) edges are placed last.
+    """
+    corners = []
+    edges = []
+    slice_edges = []
+    for x in range(SIZE):
+        for y in range(SIZE):
+            for z in range(SIZE):
+                pos = (x, y, z)
+                faces = [(axis, pos[axis] // 2) for axis in range(3) if pos[axis] != 1]
+                if len(faces) == 3:
+                    # Determinant sign of the face normals in x, y, z order
+                    sign = 1
+                    for axis, side in faces:
+                        sign *= 1 if side else -1
+                    order = (1, 2, 0) if sign > 0 else (1, 0, 2)
+                    corners.append(tuple(facelet_index(SIZE, pos, axis, faces[axis][1]) for axis in order))
+                elif len(faces) == 2:
+                    faces.sort(key=lambda face: (face[0] != 1, face[0] != 2))
+                    facelets = tuple(facelet_index(SIZE, pos, axis, side) for axis, side in faces)
+                    if y == 1:
+                        slice_edges.append(facelets)
+                    else:
+                        edges.append(facelets)
+    return corners, edges + slice_edges
+
+CORNER_FACELETS, EDGE_FACELETS = _gen_cubies()
+
+# Solved colours of each cubie (colour of a facelet in the solved state is its face)
+_SOLVED = CubeState(SIZE).facelets
+CORNER_COLS = [tuple(_SOLVED[i] for i in facelets) for facelets in CORNER_FACELETS]
+EDGE_COLS = [tuple(_SOLVED[i] for i in facelets) for facelets in EDGE_FACELETS]
+_CORNER_IDS = {frozenset(cols): i for i, cols in enumerate(CORNER_COLS)}
+_EDGE_IDS = {frozenset(cols): i for i, cols in enumerate(EDGE_COLS)}
+
+class CubieCube:
+    """
+    Cube as corner/edge permutation and orientation
+
+    Slot i holds cubie cp[i] (ep[i]) with orientation co[i] (eo[i]).
+    """
+
+    __slots__ = ('cp', 'co', 'ep', 'eo')
+
+    def __init__(self, cp=None, co=None, ep=None, eo=None):
+        self.cp = list(range(8)) if cp is None else list(cp)
+        self.co = [0] * 8 if co is None else list(co)
+        self.ep = list(range(12)) if ep is None else list(ep)
+        self.eo = [0] * 12 if eo is None else list(eo)
+
+    @classmethod
+    def from_state(cls, state):
+        """Read the cubies of a 3x3 CubeState, raising ValueError if they do not form a valid cube"""
+        if state.size != SIZE:
+            raise ValueError('Only 3x3 cubes can be solved')
+        f = state.facelets
+        cube = cls()
+        for i, facelets in enumerate(CORNER_FACELETS):
+            cols = [f[k] for k in facelets]
+            cubie = _CORNER_IDS.get(frozenset(cols))
+            if cubie is None:
+                raise ValueError(f'Invalid corner colours {cols}')
+            cube.cp[i] = cubie
+            cube.co[i] = cols.index(CORNER_COLS[cubie][0])
+        for i, facelets in enumerate(EDGE_FACELETS):
+            cols = [f[k] for k in facelets]
+            cubie = _EDGE_IDS.get(frozenset(cols))
+            if cubie is None:
+                raise ValueError(f'Invalid edge colours {cols}')
+            cube.ep[i] = cubie
+            cube.eo[i] = cols.index(EDGE_COLS[cubie][0])
+        cube.verify()
+        return cube
+
+    def to_state(self):
+        state = CubeState(SIZE)
+        f = state.facelets
+        for i, facelets in enumerate(CORNER_FACELETS):
+            cols = CORNER_COLS[self.cp[i]]
+            for j, k in enumerate(facelets):
+                f[k] = cols[(j - self.co[i]) % 3]
+        for i, facelets in enumerate(EDGE_FACELETS):
+            cols = EDGE_COLS[self.ep[i]]
+            for j, k in enumerate(facelets):
+                f[k] = cols[(j - self.eo[i]) % 2]
+        return state
+
+    def verify(self):
+        if sorted(self.cp) != list(range(8)) or sorted(self.ep) != list(range(12)):
+            raise ValueError('Duplicate cubies')
+        if sum(self.co) % 3:
+            raise ValueError('Twisted corner')
+        if sum(self.eo) % 2:
+            raise ValueError('Flipped edge')
+        if _parity(self.cp) != _parity(self.ep):
+            raise ValueError('Permutation parity mismatch')
+
+    def multiply(self, other):
+        """Apply another cube (eg. a move) to this one in place"""
+        cp, co, ep, eo = self.cp, self.co, self.ep, self.eo
+        self.cp = [cp[i] for i in other.cp]
+        self.co = [(co[i] + o) % 3 for i, o in zip(other.cp, other.co)]
+        self.ep = [ep[i] for i in other.ep]
+        self.eo = [(eo[i] + o) % 2 for i, o in zip(other.ep, other.eo)]
+
+    def __repr__(self):
+        return f'<CubieCube cp={self.cp} co={self.co} ep={self.ep} eo={self.eo}>'
+
+def _parity(perm):
+    parity = 0
+    for i in range(len(perm)):
+        for j in range(i):
+            if perm[j] > perm[i]:
+                parity ^= 1
+    return parity
+
+def _gen_move_cubes():
+    cubes = []
+    for name in MOVE_NAMES:
+        state = CubeState(SIZE)
+        state.apply(name)
+        cubes.append(CubieCube.from_state(state))
+    return cubes
+
+MOVE_CUBES = _gen_move_cubes()
+
+# --- Coordinates ---
+
+def perm_rank(perm):
+    """Lehmer code rank of a permutation of range(len(perm))"""
+    rank = 0
+    n = len(perm)
+    for i in range(n):
+        smaller = 0
+        for j in range(i + 1, n):
+            if perm[j] < perm[i]:
+                smaller += 1
+        rank = rank * (n - i) + smaller
+    return rank
+
+def perm_unrank(rank, n):
+    digits = []
+    for base in range(1, n + 1):
+        rank, digit = divmod(rank, base)
+        digits.append(digit)
+    remaining = list(range(n))
+    return [remaining.pop(digit) for digit in reversed(digits)]
+
+# E-slice edge position sets, ordered so the solved positions come first
+_SLICE_POSITIONS = list(combinations(range(12), 4))[::-1]
+_SLICE_INDEX = {positions: i for i, positions in enumerate(_SLICE_POSITIONS)}
+
+def twist_coord(co):
+    twist = 0
+    for o in co[:7]:
+        twist = twist * 3 + o
+    return twist
+
+def twist_cube(twist):
+    co = [0] * 8
+    for i in range(6, -1, -1):
+        twist, co[i] = divmod(twist, 3)
+    co[7] = -sum(co) % 3
+    return co
+
+def flip_coord(eo):
+    flip = 0
+    for o in eo[:11]:
+        flip = flip * 2 + o
+    return flip
+
+def flip_cube(flip):
+    eo = [0] * 12
+    for i in range(10, -1, -1):
+        flip, eo[i] = divmod(flip, 2)
+    eo[11] = sum(eo) % 2
+    return eo
+
+def slice_coord(ep):
+    return _SLICE_INDEX[tuple(i for i, e in enumerate(ep) if e >= 8)]
+
+class TableBuilder:
+    """Generates the tables from scratch (move tables hold one tuple of next coordinates per coordinate)"""
+
+    @cached_property
+    def twist_move(self):
+        table = []
+        for twist in range(N_TWIST):
+            co = twist_cube(twist)
+            table.append(tuple(twist_coord([(co[i] + o) % 3 for i, o in zip(m.cp, m.co)]) for m in MOVE_CUBES))
+        return table
+
+    @cached_property
+    def flip_move(self):
+        table = []
+        for flip in range(N_FLIP):
+            eo = flip_cube(flip)
+            table.append(tuple(flip_coord([(eo[i] + o) % 2 for i, o in zip(m.ep, m.eo)]) for m in MOVE_CUBES))
+        return table
+
+    @cached_property
+    def slice_move(self):
+        table = []
+        for positions in _SLICE_POSITIONS:
+            occupied = [8 if i in positions else 0 for i in range(12)]
+            table.append(tuple(slice_coord([occupied[i] for i in m.ep]) for m in MOVE_CUBES))
+        return table
+
+    @cached_property
+    def corner_move(self):
+        table = []
+        for rank in range(N_PERM_8):
+            cp = perm_unrank(rank, 8)
+            table.append(tuple(perm_rank([cp[i] for i in MOVE_CUBES[m].cp]) for m in P2_MOVES))
+        return table
+
+    @cached_property
+    def edge_move(self):
+        table = []
+        for rank in range(N_PERM_8):
+            ep = perm_unrank(rank, 8)
+            table.append(tuple(perm_rank([ep[i] for i in MOVE_CUBES[m].ep[:8]]) for m in P2_MOVES))
+        return table
+
+    @cached_property
+    def slice_perm_move(self):
+        table = []
+        for rank in range(N_PERM_4):
+            ep = perm_unrank(rank, 4)
+            table.append(tuple(perm_rank([ep[i - 8] for i in MOVE_CUBES[m].ep[8:]]) for m in P2_MOVES))
+        return table
+
+    @cached_property
+    def slice_twist_prune(self):
+        return gen_prune_table(self.slice_move, self.twist_move)
+
+    @cached_property
+    def slice_flip_prune(self):
+        return gen_prune_table(self.slice_move, self.flip_move)
+
+    @cached_property
+    def slice_corner_prune(self):
+        return gen_prune_table(self.slice_perm_move, self.corner_move)
+
+    @cached_property
+    def slice_edge_prune(self):
+        return gen_prune_table(self.slice_perm_move, self.edge_move)
+
+def gen_prune_table(move_a, move_b):
+    """
+    Breadth first search distances to the solved state (coordinates 0, 0)
+    over the product of two coordinates, indexed a * len(move_b) + b
+    """
+    n_b = len(move_b)
+    table = bytearray([UNKNOWN]) * (len(move_a) * n_b)
+    table[0] = 0
+    frontier = [0]
+    depth = 0
+    while frontier:
+        depth += 1
+        next_frontier = []
+        for index in frontier:
+            a, b = divmod(index, n_b)
+            for new_a, new_b in zip(move_a[a], move_b[b]):
+                new_index = new_a * n_b + new_b
+                if table[new_index] == UNKNOWN:
+                    table[new_index] = depth
+                    next_frontier.append(new_index)
+        frontier = next_frontier
+    return table
+
+class Tables:
+    """
+    Solver tables, memory mapped from tables.TABLE_DIR (generated and stored on first use)
+
+    Move tables are flat uint16 arrays indexed coord * moves + move.
+    Pruning tables are nibble packed, indexed as in gen_prune_table.
+    """
+
+    VERSION = 1
+
+    def __init__(self):
+        builder = TableBuilder() # Only does any work for missing tables
+
+        def move_table(name, n_coords, n_moves):
+            flatten = lambda: [new for row in getattr(builder, name) for new in row]
+            return tables.load(f'solver_{name}.v{self.VERSION}.u16', 'H', n_coords * n_moves, flatten)
+
+        def prune_table(name, n_entries):
+            pack = lambda: tables.pack_nibbles(getattr(builder, name))
+            return tables.load(f'solver_{name}.v{self.VERSION}.nib', 'B', (n_entries + 1) // 2, pack)
+
+        self.twist_move = move_table('twist_move', N_TWIST, N_MOVES)
+        self.flip_move = move_table('flip_move', N_FLIP, N_MOVES)
+        self.slice_move = move_table('slice_move', N_SLICE, N_MOVES)
+        self.corner_move = move_table('corner_move', N_PERM_8, N_P2_MOVES)
+        self.edge_move = move_table('edge_move', N_PERM_8, N_P2_MOVES)
+        self.slice_perm_move = move_table('slice_perm_move', N_PERM_4, N_P2_MOVES)
+
+        self.slice_twist_prune = prune_table('slice_twist_prune', N_SLICE * N_TWIST)
+        self.slice_flip_prune = prune_table('slice_flip_prune', N_SLICE * N_FLIP)
+        self.slice_corner_prune = prune_table('slice_corner_prune', N_PERM_4 * N_PERM_8)
+        self.slice_edge_prune = prune_table('slice_edge_prune', N_PERM_4 * N_PERM_8)
+
+_tables = None
+
+def get_tables():
+    """Shared tables, loaded on first use"""
+    global _tables
+    if _tables is None:
+        _tables = Tables()
+    return _tables
+
+def _gen_allowed():
+    """
+    Moves allowed after each face (index 6 = no previous move)
+
+    Turning the same face twice in a row is never needed, and turns of
+    opposite faces commute so only one order of them is searched.
+    """
+    allowed = []
+    for last in range(len(FACES) + 1):
+        moves = []
+        for m in range(N_MOVES):
+            face = m // 3
+            if last < len(FACES) and (face == last or (face // 2 == last // 2 and face < last)):
+                continue
+            moves.append(m)
+        allowed.append(moves)
+    return allowed
+
+ALLOWED = _gen_allowed()
+P2_ALLOWED = [[(i, m) for i, m in enumerate(P2_MOVES) if m in moves] for moves in ALLOWED]
+
+class Search:
+    """
+    Two-phase search for the shortest solution it can find of at most max_length moves
+
+    Phase 1 solutions are tried in order of length, each completed with the
+    shortest phase 2 solution. The first solution found is rarely the
+    shortest (eg. a phase 1 ending on R leaves phase 2 unable to turn R), so
+    the search carries on for shorter ones, bounded by one move less than
+    the best so far. Once there is a solution, it stops after probes more
+    phase 2 searches (None: no limit), or after time_limit seconds (if
+    given - the result then depends on the machine), or when phase 1 alone
+    gets as long as the best solution, which proves it optimal.
+
+    With optimal=True, the search is an IDA* on the total length instead:
+    every phase 1 / phase 2 split is tried at each length bound, so the
+    first solution found is optimal. Without tables for the whole cube that
+    is only practical for positions up to about 10 moves from solved.
+    """
+
+    PROBES = 20
+
+    def __init__(self, cube, max_length, tables, probes=PROBES, time_limit=None, optimal=False):
+        self.cube = cube
+        self.max_length = max_length
+        self.tables = tables
+        self.probes = probes
+        self.deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        self.optimal = optimal
+        self.moves = []
+        self.best = None
+
+    def run(self):
+        t = self.tables
+        twist = twist_coord(self.cube.co)
+        flip = flip_coord(self.cube.eo)
+        slice_ = slice_coord(self.cube.ep)
+        dist = max(nibble(t.slice_twist_prune, slice_ * N_TWIST + twist), nibble(t.slice_flip_prune, slice_ * N_FLIP + flip))
+
+        if self.optimal:
+            max_length, self.probes = self.max_length, 0 # Stop at the first solution
+            for bound in range(dist, max_length + 1):
+                self.max_length = bound
+                depth = dist
+                while depth <= self.max_length and not self.phase1(twist, flip, slice_, depth, len(FACES)):
+                    depth += 1
+                if self.best is not None:
+                    break
+        else:
+            depth = dist
+            while depth <= self.max_length and not self.phase1(twist, flip, slice_, depth, len(FACES)):
+                depth += 1
+        return [MOVE_NAMES[m] for m in self.best] if self.best is not None else None
+
+    def phase1(self, twist, flip, slice_, togo, last):
+        """Search phase 1 solutions of togo more moves - True once the search is over"""
+        if togo == 0:
+            # Phase 1 complete: a phase 2 move last means a shorter phase 1 solution was already tried
+            if self.moves and self.moves[-1] in P2_MOVES:
+                return False
+            return self.start_phase2()
+
+        t = self.tables
+        twist_move, flip_move, slice_move = t.twist_move, t.flip_move, t.slice_move
+        twist_prune, flip_prune = t.slice_twist_prune, t.slice_flip_prune
+        twist, flip, slice_ = twist * N_MOVES, flip * N_MOVES, slice_ * N_MOVES
+        for m in ALLOWED[last]:
+            new_twist = twist_move[twist + m]
+            new_flip = flip_move[flip + m]
+            new_slice = slice_move[slice_ + m]
+
+            # Inlined nibble lookups (see tables.nibble)
+            i = new_slice * N_TWIST + new_twist
+            dist = twist_prune[i >> 1] >> ((i & 1) << 2) & 15
+            if dist >= togo:
+                continue
+            i = new_slice * N_FLIP + new_flip
+            dist = flip_prune[i >> 1] >> ((i & 1) << 2) & 15
+            if dist >= togo:
+                continue
+
+            self.moves.append(m)
+            done = self.phase1(new_twist, new_flip, new_slice, togo - 1, m // 3)
+            self.moves.pop()
+            if done:
+                return True
+        return False
+
+    def start_phase2(self):
+        """Complete a phase 1 solution with the shortest phase 2 solution that beats the best - True once the search is over"""
+        phase1_length = len(self.moves)
+        if phase1_length > self.max_length:
+            return True # Every other phase 1 solution is at least as long
+
+        t = self.tables
+        cube = CubieCube(self.cube.cp, ep=self.cube.ep)
+        for m in self.moves:
+            cube.multiply(MOVE_CUBES[m])
+        corner = perm_rank(cube.cp)
+        edge = perm_rank(cube.ep[:8])
+        slice_perm = perm_rank([e - 8 for e in cube.ep[8:]])
+
+        dist = max(nibble(t.slice_corner_prune, slice_perm * N_PERM_8 + corner), nibble(t.slice_edge_prune, slice_perm * N_PERM_8 + edge))
+        last = self.moves[-1] // 3 if self.moves else len(FACES)
+        probe = self.best is not None
+        for depth in range(dist, self.max_length - phase1_length + 1):
+            if self.phase2(corner, edge, slice_perm, depth, last):
+                self.best = list(self.moves)
+                self.max_length = len(self.best) - 1
+                del self.moves[phase1_length:]
+                break
+
+        if self.best is None:
+            return False
+        if self.probes is not None:
+            self.probes -= probe
+            if self.probes <= 0:
+                return True
+        return self.deadline is not None and time.perf_counter() > self.deadline
+
+    def phase2(self, corner, edge, slice_perm, togo, last):
+        """Search phase 2 solutions of togo more moves - True if found (leaving its moves in self.moves)"""
+        if togo == 0:
+            return corner == 0 and edge == 0 and slice_perm == 0
+
+        t = self.tables
+        corner_move, edge_move, slice_perm_move = t.corner_move, t.edge_move, t.slice_perm_move
+        corner_prune, edge_prune = t.slice_corner_prune, t.slice_edge_prune
+        corner, edge, slice_perm = corner * N_P2_MOVES, edge * N_P2_MOVES, slice_perm * N_P2_MOVES
+        for p2_m, m in P2_ALLOWED[last]:
+            new_corner = corner_move[corner + p2_m]
+            new_edge = edge_move[edge + p2_m]
+            new_slice = slice_perm_move[slice_perm + p2_m]
+
+            # Inlined nibble lookups (see tables.nibble)
+            i = new_slice * N_PERM_8 + new_corner
+            dist = corner_prune[i >> 1] >> ((i & 1) << 2) & 15
+            if dist >= togo:
+                continue
+            i = new_slice * N_PERM_8 + new_edge
+            dist = edge_prune[i >> 1] >> ((i & 1) << 2) & 15
+            if dist >= togo:
+                continue
+
+            self.moves.append(m)
+            if self.phase2(new_corner, new_edge, new_slice, togo - 1, m // 3):
+                return True
+            self.moves.pop()
+        return False
+
+def solve(state, max_length=24, cache=None, probes=Search.PROBES, time_limit=None, optimal=False):
+    """
+    Solve a cube, returning a list of moves (eg. ['R', 'U2', 'F\\'']) that can be
+    fed straight into Cube.move_queue
+
+    Accepts a CubeState or anything with a state attribute (eg. Cube).
+    Solutions are near optimal, improving with more probes / time (see
+    Search), or optimal with optimal=True. Returns None if the search found
+    no solution of at most max_length moves - with optimal=True that means
+    none exists, otherwise it only means the two-phase search gave up (it
+    may fail below about 20 moves for positions with shorter solutions).
+    If a symmetry.TranspositionCache is given, solutions are looked up in
+    and added to it (so symmetric equivalents of solved positions are free).
+    Optimal searches do not use the cache, as its solutions need not be
+    optimal.
+    """
+    state = getattr(state, 'state', state)
+    return _solve(state, max_length, get_tables(), cache, probes, time_limit, optimal)
+
+def solve_many(states, max_length=24, cache=None, probes=Search.PROBES, time_limit=None, optimal=False):
+    """Solve many cubes, sharing one set of tables (generator of solutions in input order)"""
+    shared = get_tables()
+    for state in states:
+        state = getattr(state, 'state', state)
+        yield _solve(state, max_length, shared, cache, probes, time_limit, optimal)
+
+def _solve(state, max_length, shared, cache, probes, time_limit, optimal):
+    cube = CubieCube.from_state(state)
+    search = lambda: Search(cube, max_length, shared, probes, time_limit, optimal).run()
+    if cache is None or optimal:
+        return search()
+
+    entry = cache.get(state)
+    if entry is not None:
+        solution_length, solution = entry
+        if solution is not None and solution_length <= max_length:
+            return solution
+    solution = search()
+    if solution is not None:
+        cache.put(state, len(solution), solution)
+    return solution
+
+if __name__ == '__main__':
+    # Pre-generate the stored tables (eg. when building a server image)
+    get_tables()
+    print(f'Solver tables ready in {tables.TABLE_DIR}')
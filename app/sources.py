@@ -0,0 +1,157 @@
+"""
+Asynchronous move sources, for feeding a cube from outside the window
+
+Each source is a coroutine that pushes moves into Cube.move_queue as they
+arrive. Run them alongside the window with GameWindow.run_async, eg:
+
+    game = Game()
+    asyncio.run(game.run_async(serve_unix(game.cube, '/tmp/rubicks.sock')))
+
+Sources only ever await (for I/O, timers or executor jobs), so they never
+hold up a frame.
+
+Socket and pipe sources read one line at a time, each a whitespace
+separated move sequence (eg. "R U2 F'"). Sockets reply 'ok' or 'error: ...'
+to every line, and the command 'solve' queues a solution of the cube.
+"""
+
+import asyncio
+import multiprocessing
+import sys
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+from app.state import CubeState
+from app.movelog import MAX_GAP, close_gaps
+from app.sequence import decode, parse
+
+def queue_moves(cube, line):
+    """Queue the moves of a line of text (raises ValueError for invalid moves, queueing none of them)"""
+    cube.move_queue.extend(parse(line, cube.size))
+
+def target_state(cube):
+    """State the cube will be in once the current move and every queued move are done"""
+    state = cube.state.copy()
+    if cube.is_moving:
+        state.apply_turn(cube.move_axis, cube.move_layers, cube.move_rot // 90)
+    for code in cube.move_queue:
+        state.apply_turn(*decode(code))
+    return state
+
+_executor = None
+
+def _default_executor():
+    # The solver is CPU bound pure Python, so it runs in another process to keep the GIL free for rendering
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+def shutdown_executor():
+    """Stop the default solver process (if started), without waiting for a solve in progress"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def solve(cube, max_length=24, executor=None):
+    """
+    Solve the cube in an executor (default: a separate process) and queue the solution
+
+    The cube is solved as it will be after the moves already queued. Returns
+    the solution, or None if none was found (or the cube is not a 3x3).
+    """
+    if cube.size != 3:
+        return None
+    from app import solver
+
+    global _executor
+    loop = asyncio.get_running_loop()
+    state = target_state(cube)
+    try:
+        solution = await loop.run_in_executor(executor or _default_executor(), solver.solve, state, max_length)
+    except BrokenExecutor:
+        if executor is None:
+            _executor = None # The solver process died - start a new one next time
+        raise
+    if solution is not None:
+        # Only valid if nothing was queued while solving
+        if target_state(cube) == state:
+            cube.move_queue.extend(solution)
+        else:
+            solution = None
+    return solution
+
+async def handle_lines(cube, reader, writer=None):
+    """Queue the moves of every line from a StreamReader (replying on writer, if given)"""
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        line = line.decode(errors='replace').strip()
+
+        try:
+            if line == 'solve':
+                reply = 'ok' if await solve(cube) is not None else 'error: no solution'
+            else:
+                queue_moves(cube, line)
+                reply = 'ok'
+        except Exception as e: # Invalid moves, or the solver failing
+            reply = f'error: {e}'
+
+        if writer is not None:
+            writer.write(reply.encode() + b'\n')
+            await writer.drain()
+
+async def _serve(cube, start_server, *args):
+    async def client(reader, writer):
+        try:
+            await handle_lines(cube, reader, writer)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await start_server(client, *args)
+    async with server:
+        await server.serve_forever()
+
+async def serve_unix(cube, path):
+    """Accept move lines from clients of a local (unix domain) socket"""
+    await _serve(cube, asyncio.start_unix_server, path)
+
+async def serve_tcp(cube, host='127.0.0.1', port=7385):
+    """Accept move lines from TCP clients (local only by default)"""
+    await _serve(cube, asyncio.start_server, host, port)
+
+async def serve(cube, address):
+    """Serve on 'host:port' (TCP) or a unix socket path"""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        await serve_tcp(cube, host or '127.0.0.1', int(port))
+    else:
+        await serve_unix(cube, address)
+
+async def read_pipe(cube, pipe=None):
+    """Queue move lines read from a pipe or file object (default: stdin)"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe or sys.stdin)
+    await handle_lines(cube, reader)
+
+async def replay(cube, log, start=0, speed=1.0, max_gap=MAX_GAP):
+    """Stream a movelog.MoveLog into the cube, keeping to the recorded timing (see movelog.Replayer)"""
+    loop = asyncio.get_running_loop()
+    state, events = log.seek(start)
+    cube.set_state(state)
+
+    began = first = None
+    for _, time, item in close_gaps(events, max_gap):
+        if began is None:
+            began, first = loop.time(), time
+        delay = began + (time - first) / speed - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if isinstance(item, CubeState):
+            cube.set_state(item)
+        else:
+            cube.move_queue.append(item)
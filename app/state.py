@@ -0,0 +1,229 @@
+"""Headless facelet model of the cube, independent of the rendering geometry"""
+
+from functools import lru_cache
+from operator import itemgetter
+import re
+
+# Face colours, indexed by face number (face = axis * 2 + side)
+# X=0, Y=1, Z=2 / Side: -ve=0, +ve=1
+FACE_COLS = (
+    'GREEN',  # -ve x
+    'BLUE',   # +ve x
+    'WHITE',  # -ve y
+    'YELLOW', # +ve y
+    'RED',    # -ve z
+    'ORANGE', # +ve z
+)
+
+# Face turns: (Axis (X=0/Y=1/Z=2), Side (-ve=0/+ve=1))
+FACE_MOVES = {
+    'L': (0, 0),
+    'R': (0, 1),
+    'U': (1, 0),
+    'D': (1, 1),
+    'F': (2, 0),
+    'B': (2, 1)
+}
+
+_OTHER_AXES = ((1, 2), (0, 2), (0, 1))
+
+def other_axes(axis):
+    """The two axes perpendicular to the given axis (in increasing order)"""
+    return _OTHER_AXES[axis]
+
+# Slice turns (all layers between the two outer faces), by axis
+SLICE_MOVES = {
+    'M': 0,
+    'E': 1,
+    'S': 2
+}
+
+# [layer number] face/slice letter [W (wide)] [2 (double) / ' (reverse)]
+MOVE_PATTERN = re.compile(r"^(\d*)([LRUDFBMES])(W?)(2?'?)$")
+
+@lru_cache(maxsize=4096)
+def parse_move(move, size=3):
+    """
+    Parse a move string into (axis, layers, clockwise quarter turns)
+
+    Supported notation:
+    'R', 'R\'', 'R2'  Outer layer of a face
+    '2R', '3R'       Single inner layer, counted from the face
+    'Rw', '3Rw'      Wide turn of the outer 2 (or given number of) layers
+    'M', 'E', 'S'    All inner layers along the x, y and z axis
+    """
+    match = MOVE_PATTERN.match(move.upper())
+    if match is None:
+        raise ValueError(f'Invalid move {move!r}')
+    count, letter, wide, suffix = match.groups()
+
+    turns = 1
+    if suffix.startswith('2'): # Double move
+        turns = 2
+    elif suffix == '\'': # Reverse (prime / -90 degrees) move
+        turns = 3
+
+    if letter in SLICE_MOVES:
+        if count or wide or size < 3:
+            raise ValueError(f'Invalid move {move!r}')
+        return SLICE_MOVES[letter], tuple(range(1, size - 1)), turns
+
+    axis, side = FACE_MOVES[letter]
+    count = int(count) if count else (2 if wide else 1)
+    if not 1 <= count <= size:
+        raise ValueError(f'Invalid move {move!r} for a {size}x{size} cube')
+    depths = range(count) if wide else [count - 1]
+    layers = tuple(sorted(depth if side == 0 else size - 1 - depth for depth in depths))
+    return axis, layers, turns
+
+def facelet_index(size, pos, axis, side):
+    """Index of the facelet on the given block face, or None if the face is inside the cube"""
+    if pos[axis] != side * (size - 1):
+        return None
+    a, b = other_axes(axis)
+    return (axis * 2 + side) * size * size + pos[a] * size + pos[b]
+
+def _rotate(vec, axis, turns):
+    """Rotate an integer vector clockwise around an axis by a number of quarter turns"""
+    vec = list(vec)
+    a, b = other_axes(axis)
+    for _ in range(turns):
+        vec[a], vec[b] = vec[b], -vec[a] # Same sense as trig.origin_rotate
+    return vec
+
+@lru_cache(maxsize=None)
+def turn_perm(size, axis, layer, turns):
+    """
+    Facelet permutation for turning a single layer
+
+    The permutation is in gather form: after the turn, facelet i holds the
+    colour previously held by facelet perm[i]
+    """
+    perm = list(range(6 * size * size))
+    for axis_i in range(3):
+        for side_i in range(2):
+            for i in range(size):
+                for j in range(size):
+                    pos = [0, 0, 0]
+                    pos[axis_i] = side_i * (size - 1)
+                    a, b = other_axes(axis_i)
+                    pos[a], pos[b] = i, j
+
+                    # Only facelets on blocks within the turning layer move
+                    if pos[axis] != layer:
+                        continue
+
+                    # Rotate block position (doubled so the centre is the origin) and face normal
+                    centred = _rotate([2 * x - (size - 1) for x in pos], axis, turns)
+                    normal = [0, 0, 0]
+                    normal[axis_i] = 1 if side_i else -1
+                    normal = _rotate(normal, axis, turns)
+
+                    new_axis = [abs(x) for x in normal].index(1)
+                    new_side = 1 if normal[new_axis] > 0 else 0
+                    new_pos = [(x + size - 1) // 2 for x in centred]
+
+                    src = facelet_index(size, pos, axis_i, side_i)
+                    perm[facelet_index(size, new_pos, new_axis, new_side)] = src
+    return tuple(perm)
+
+@lru_cache(maxsize=None)
+def move_perm(size, axis, layers, turns):
+    """Facelet permutation (gather form) for turning several layers at once"""
+    perm = list(range(6 * size * size))
+    for layer in layers:
+        layer_perm = turn_perm(size, axis, layer, turns)
+        perm = [perm[i] for i in layer_perm] # Layers are disjoint, so order does not matter
+    return tuple(perm)
+
+@lru_cache(maxsize=None)
+def _move_applier(size, axis, layers, turns):
+    """
+    Function applying a move to a facelet bytearray in place (returning it)
+
+    Moves touching a small part of the cube (eg. inner slices of large cubes)
+    only rewrite the facelets that move; others rebuild the whole array.
+    """
+    perm = move_perm(size, axis, layers, turns)
+    moved = [i for i, src in enumerate(perm) if i != src]
+    if len(moved) * 4 >= len(perm):
+        getter = itemgetter(*perm)
+        def apply(facelets):
+            facelets[:] = getter(facelets)
+            return facelets
+        return apply
+
+    src_getter = itemgetter(*[perm[i] for i in moved])
+    def apply(facelets):
+        for i, col in zip(moved, src_getter(facelets)):
+            facelets[i] = col
+        return facelets
+    return apply
+
+# Facelet colours <-> octal digits, for packing a state into an integer (3 bits per facelet)
+_TO_OCTAL = bytes.maketrans(bytes(range(8)), b'01234567')
+_FROM_OCTAL = bytes.maketrans(b'01234567', bytes(range(8)))
+
+class CubeState:
+    """
+    Flat array of facelet colours (one byte per facelet)
+
+    Facelets are stored face by face (face = axis * 2 + side), each face as a
+    row-major grid over the two remaining axes. Values index FACE_COLS.
+    """
+
+    __slots__ = ('size', 'facelets')
+
+    def __init__(self, size=3, facelets=None):
+        self.size = size
+        if facelets is None:
+            facelets = bytearray(face for face in range(6) for _ in range(size * size))
+        self.facelets = bytearray(facelets)
+
+    def copy(self):
+        return CubeState(self.size, self.facelets)
+
+    def col(self, pos, axis, side):
+        """Colour index of a block face (None for faces inside the cube)"""
+        i = facelet_index(self.size, pos, axis, side)
+        if i is None:
+            return None
+        return self.facelets[i]
+
+    def apply_turn(self, axis, layers, turns):
+        """Turn layers (a tuple of layer positions along the axis) clockwise by a number of quarter turns"""
+        turns %= 4
+        if turns:
+            self.facelets = _move_applier(self.size, axis, layers, turns)(self.facelets)
+
+    def apply(self, move):
+        """Apply a move in cube notation (eg. 'L', 'R\'', 'U2', 'M', '2R', 'Rw' - see parse_move)"""
+        self.apply_turn(*parse_move(move, self.size))
+
+    def apply_sequence(self, moves):
+        for move in moves:
+            self.apply(move)
+
+    def pack(self):
+        """Compact hashable encoding of the facelets: an integer holding 3 bits per facelet"""
+        return int(bytes(self.facelets).translate(_TO_OCTAL), 8)
+
+    @classmethod
+    def unpack(cls, size, packed):
+        digits = format(packed, 'o').zfill(6 * size * size)
+        return cls(size, digits.encode().translate(_FROM_OCTAL))
+
+    def __eq__(self, other):
+        if not isinstance(other, CubeState):
+            return NotImplemented
+        return self.size == other.size and self.facelets == other.facelets
+
+    __hash__ = None # Mutable - hash pack() instead
+
+    def is_solved(self):
+        n = self.size * self.size
+        f = self.facelets
+        return all(f.count(f[face * n], face * n, (face + 1) * n) == n for face in range(6))
+
+    def __repr__(self):
+        return f'<CubeState size={self.size} facelets={bytes(self.facelets).hex()}>'
@@ -0,0 +1,552 @@
+"""
+State space analysis: exhaustive breadth first search of the 2x2 and of
+bounded depth neighbourhoods of any cube
+
+2x2 positions are numbered by a perfect hash: with the DLB corner held fixed
+(only R, U and F are turned), a position is the permutation of the other 7
+corners (7! = 5040) and the twist of 6 of them (3^6 = 729, the 7th is
+implied), 3,674,160 positions in all. The search keeps its visited and
+frontier sets as bit arrays over that numbering, and writes each position's
+distance (half turn metric) into a nibble packed table, stored with the
+solver tables (see app.tables) and memory mapped on later use.
+
+3x3 neighbourhood searches number positions by their cubie coordinates
+(a perfect hash of about 66 bits, see state_key), and hold each level as
+sorted arrays of 64 bit keys, about 8 bytes per position. Other cubes have
+no compact numbering, so their levels are sets of packed facelet strings.
+Only the last two levels are kept, as a move from level d can only reach
+levels d - 1, d and d + 1.
+
+Both searches can split each level across worker processes.
+
+Usage: python -m app.statespace 2x2 [-j processes]
+       python -m app.statespace neighbourhood [--size 3] [--depth 5] [-j processes]
+"""
+
+import argparse
+import heapq
+import mmap
+import multiprocessing
+from array import array
+from bisect import bisect_left
+from itertools import combinations, islice
+from operator import itemgetter
+
+from app import tables
+from app.tables import nibble
+from app.state import CubeState, move_perm, parse_move
+from app.solver import CORNER_FACELETS, MOVE_NAMES, MOVE_CUBES, perm_rank, perm_unrank
+
+# --- 2x2 numbering ---
+
+N_PERM_7 = 5040
+N_TWIST_6 = 729
+N_2X2 = N_PERM_7 * N_TWIST_6
+
+MOVES_2X2 = [name for name in MOVE_NAMES if name[0] in 'RUF']
+_MOVE_CUBES_2X2 = [MOVE_CUBES[MOVE_NAMES.index(name)] for name in MOVES_2X2]
+
+# Corner slot untouched by R, U and F (DLB)
+FIXED_SLOT = next(slot for slot in range(8) if all(m.cp[slot] == slot and m.co[slot] == 0 for m in _MOVE_CUBES_2X2))
+_FREE_SLOTS = [slot for slot in range(8) if slot != FIXED_SLOT]
+
+def _to_2x2(index):
+    """Facelet index on a 2x2 of a 3x3 corner facelet index"""
+    face, rest = divmod(index, 9)
+    a, b = divmod(rest, 3)
+    return face * 4 + a // 2 * 2 + b // 2
+
+CORNER_FACELETS_2X2 = [tuple(_to_2x2(i) for i in facelets) for facelets in CORNER_FACELETS]
+_SOLVED_2X2 = CubeState(2).facelets
+_CORNER_COLS = [tuple(_SOLVED_2X2[i] for i in facelets) for facelets in CORNER_FACELETS_2X2]
+_CORNER_IDS = {frozenset(cols): i for i, cols in enumerate(_CORNER_COLS)}
+
+def coords_index(cp, co):
+    """Position number of a corner permutation and orientation (with the fixed corner solved)"""
+    perm = perm_rank([_FREE_SLOTS.index(cp[slot]) for slot in _FREE_SLOTS])
+    twist = 0
+    for slot in _FREE_SLOTS[:6]:
+        twist = twist * 3 + co[slot]
+    return perm * N_TWIST_6 + twist
+
+def index_coords(index):
+    perm, twist = divmod(index, N_TWIST_6)
+    free = perm_unrank(perm, 7)
+    cp = list(range(8))
+    co = [0] * 8
+    for slot, cubie in zip(_FREE_SLOTS, free):
+        cp[slot] = _FREE_SLOTS[cubie]
+    for slot in reversed(_FREE_SLOTS[:6]):
+        twist, co[slot] = divmod(twist, 3)
+    co[_FREE_SLOTS[6]] = -sum(co) % 3
+    return cp, co
+
+def _rotations(size):
+    """Facelet permutations of the 24 whole cube rotations (colours unchanged)"""
+    layers = tuple(range(size))
+    generators = [move_perm(size, 0, layers, 1), move_perm(size, 1, layers, 1)]
+    found = {tuple(range(6 * size * size))}
+    frontier = list(found)
+    while frontier:
+        new = []
+        for perm in frontier:
+            for gen in generators:
+                composed = tuple(perm[i] for i in gen)
+                if composed not in found:
+                    found.add(composed)
+                    new.append(composed)
+        frontier = new
+    return [itemgetter(*perm) for perm in found]
+
+_ROTATIONS_2X2 = _rotations(2)
+
+def state_index(state):
+    """
+    Position number of a 2x2 CubeState
+
+    The cube is first turned as a whole so the DLB corner is in place (a 2x2
+    has no centres, so this does not change the position). Raises ValueError
+    if the state is not a valid 2x2.
+    """
+    if state.size != 2:
+        raise ValueError('Only 2x2 cubes are numbered')
+    fixed = CORNER_FACELETS_2X2[FIXED_SLOT]
+    target = _CORNER_COLS[FIXED_SLOT]
+    for rotate in _ROTATIONS_2X2:
+        f = rotate(state.facelets)
+        if tuple(f[i] for i in fixed) == target:
+            break
+    else:
+        raise ValueError('DLB corner not found')
+
+    cp, co = [0] * 8, [0] * 8
+    for slot, facelets in enumerate(CORNER_FACELETS_2X2):
+        cols = [f[i] for i in facelets]
+        cubie = _CORNER_IDS.get(frozenset(cols))
+        if cubie is None:
+            raise ValueError(f'Invalid corner colours {cols}')
+        cp[slot] = cubie
+        co[slot] = cols.index(_CORNER_COLS[cubie][0])
+    if sorted(cp) != list(range(8)) or sum(co) % 3:
+        raise ValueError('Invalid corners')
+    return coords_index(cp, co)
+
+def index_state(index):
+    """2x2 CubeState of a position number"""
+    cp, co = index_coords(index)
+    state = CubeState(2)
+    f = state.facelets
+    for slot, facelets in enumerate(CORNER_FACELETS_2X2):
+        cols = _CORNER_COLS[cp[slot]]
+        for j, i in enumerate(facelets):
+            f[i] = cols[(j - co[slot]) % 3]
+    return state
+
+def _gen_move_tables():
+    """Flat (coordinate * moves + move) tables of the next permutation and twist coordinates"""
+    n_moves = len(MOVES_2X2)
+    perm_move = array('H', bytes(2 * N_PERM_7 * n_moves))
+    twist_move = array('H', bytes(2 * N_TWIST_6 * n_moves))
+    for perm in range(N_PERM_7):
+        cp, co = index_coords(perm * N_TWIST_6)
+        for j, m in enumerate(_MOVE_CUBES_2X2):
+            new_cp = [cp[i] for i in m.cp]
+            perm_move[perm * n_moves + j] = coords_index(new_cp, co) // N_TWIST_6
+    for twist in range(N_TWIST_6):
+        cp, co = index_coords(twist)
+        for j, m in enumerate(_MOVE_CUBES_2X2):
+            new_co = [(co[i] + o) % 3 for i, o in zip(m.cp, m.co)]
+            twist_move[twist * n_moves + j] = coords_index(cp, new_co) % N_TWIST_6
+    return perm_move, twist_move
+
+# --- Bit arrays ---
+
+def _set_bits(bits, start, end):
+    """Indices of the set bits in bytes start to end of a bit array"""
+    for byte_i in range(start, end):
+        byte = bits[byte_i]
+        if byte:
+            base = byte_i << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    yield base + bit
+
+# Search state shared with worker processes (inherited when they are forked)
+_shared = {}
+
+def _expand_2x2(start, end):
+    """New positions (not yet visited) one move away from the frontier positions in bytes start to end"""
+    visited, frontier = _shared['visited'], _shared['frontier']
+    perm_move, twist_move = _shared['perm_move'], _shared['twist_move']
+    n_moves = len(MOVES_2X2)
+    found = set()
+    for index in _set_bits(frontier, start, end):
+        perm, twist = divmod(index, N_TWIST_6)
+        perm *= n_moves
+        twist *= n_moves
+        for m in range(n_moves):
+            new = perm_move[perm + m] * N_TWIST_6 + twist_move[twist + m]
+            if not visited[new >> 3] >> (new & 7) & 1:
+                found.add(new)
+    return array('I', found)
+
+def _pool(processes):
+    """Pool of forked workers (None if running in this process, or fork is unavailable)"""
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context('fork').Pool(processes)
+
+def bfs_2x2(processes=None, chunk_bytes=1 << 14):
+    """
+    Distances of every 2x2 position from solved
+
+    Returns (distribution: positions at each distance, nibble packed distance
+    table indexed by position number).
+    """
+    n_bytes = (N_2X2 + 7) // 8
+    # Anonymous shared memory, so forked workers see the parent's updates
+    visited = mmap.mmap(-1, n_bytes)
+    frontier = mmap.mmap(-1, n_bytes)
+    distances = bytearray(b'\xff') * ((N_2X2 + 1) // 2)
+
+    perm_move, twist_move = _gen_move_tables()
+    _shared.update(visited=visited, frontier=frontier, perm_move=perm_move, twist_move=twist_move)
+
+    solved = state_index(CubeState(2))
+    visited[solved >> 3] |= 1 << (solved & 7)
+    frontier[solved >> 3] |= 1 << (solved & 7)
+    distances[solved >> 1] &= 0xf0 if solved & 1 == 0 else 0x0f
+    distribution = [1]
+
+    pool = _pool(processes)
+    try:
+        depth = 0
+        while distribution[-1]:
+            depth += 1
+            chunks = [(start, min(start + chunk_bytes, n_bytes)) for start in range(0, n_bytes, chunk_bytes)]
+            if pool is None:
+                results = (_expand_2x2(*chunk) for chunk in chunks)
+            else:
+                results = pool.starmap(_expand_2x2, chunks)
+
+            # Positions found from several frontier chunks are only counted once, by checking visited again
+            next_frontier = bytearray(n_bytes)
+            count = 0
+            for found in results:
+                for index in found:
+                    byte_i, bit = index >> 3, 1 << (index & 7)
+                    if not visited[byte_i] & bit:
+                        visited[byte_i] |= bit
+                        next_frontier[byte_i] |= bit
+                        shift = (index & 1) << 2
+                        distances[index >> 1] = distances[index >> 1] & ~(0xf << shift) & 0xff | depth << shift
+                        count += 1
+            frontier[:] = next_frontier
+            distribution.append(count)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _shared.clear()
+
+    distribution.pop()
+    return distribution, bytes(distances)
+
+VERSION = 1
+
+def distance_table(processes=None):
+    """2x2 distance table (nibble packed), generated on first use and then memory mapped"""
+    return tables.load(f'statespace_2x2.v{VERSION}.nib', 'B', (N_2X2 + 1) // 2, lambda: bfs_2x2(processes)[1])
+
+def distance(state, table=None):
+    """Moves (half turn metric) needed to solve a 2x2 CubeState"""
+    return nibble(table or distance_table(), state_index(state))
+
+def distribution_2x2(table=None):
+    """Positions at each distance, counted from the distance table"""
+    counts = [0] * 16
+    for byte in table or distance_table():
+        counts[byte & 15] += 1
+        counts[byte >> 4] += 1
+    if N_2X2 % 2:
+        counts[15] -= 1 # Padding nibble
+    return counts[:max(i for i, count in enumerate(counts[:15]) if count) + 1]
+
+# --- 3x3 position keys ---
+
+# A 3x3 position (centres in place) is its corner permutation and twist,
+# edge flip, and edge permutation. The edge permutation is split into three
+# groups of 4 edges (cubies 0-3, 4-7 and 8-11), each with a coordinate of
+# its positions (one of the 495 sets of 4 of the 12 slots) and the order of
+# its edges in them (4! = 24): one move table turns all three. For the key,
+# the second group's positions are numbered among the 8 slots left by the
+# first (70 ways) and the third group's are implied, so the key is a
+# perfect hash below 8! * 3^7 * 2^11 * 12! (about 2^66).
+N_PERM_8 = 40320
+N_TWIST = 3 ** 7
+N_FLIP = 2 ** 11
+N_GROUP = 495 * 24
+N_EDGES = 12 * 11 * 10 * 9 * 8 * 7 * 6 * 5 * 24 # 12!
+N_KEYS = N_PERM_8 * N_TWIST * N_FLIP * N_EDGES
+
+# Levels are kept as sorted arrays of unsigned 64 bit ints, one per bucket of key >> 64
+KEY_BITS = 64
+KEY_MASK = (1 << KEY_BITS) - 1
+N_BUCKETS = (N_KEYS >> KEY_BITS) + 1
+
+_GROUP_SLOTS = list(combinations(range(12), 4))
+_GROUP_INDEX = {slots: i for i, slots in enumerate(_GROUP_SLOTS)}
+_REST_INDEX = {slots: i for i, slots in enumerate(combinations(range(8), 4))}
+
+def _group_coord(ep, group):
+    slots = tuple(i for i, e in enumerate(ep) if e // 4 == group)
+    return _GROUP_INDEX[slots] * 24 + perm_rank([ep[i] - group * 4 for i in slots])
+
+def _gen_corner_move():
+    table = []
+    for rank in range(N_PERM_8):
+        cp = perm_unrank(rank, 8)
+        table.extend(perm_rank([cp[i] for i in m.cp]) for m in MOVE_CUBES)
+    return table
+
+def _gen_group_move():
+    table = []
+    for coord in range(N_GROUP):
+        slots, order = divmod(coord, 24)
+        ep = [-1] * 12
+        for slot, edge in zip(_GROUP_SLOTS[slots], perm_unrank(order, 4)):
+            ep[slot] = edge
+        table.extend(_group_coord([ep[i] for i in m.ep], 0) for m in MOVE_CUBES)
+    return table
+
+def _gen_group_pairs():
+    """Tables of group slot sets (a, b): key number of b among the slots left by a, b from that number, and the remaining (third) slot set"""
+    rest_number = bytearray(b'\xff') * (495 * 495)
+    from_number = array('H', bytes(2 * 495 * 70))
+    third = array('H', bytes(2 * 495 * 495))
+    for a, slots_a in enumerate(_GROUP_SLOTS):
+        rest = [slot for slot in range(12) if slot not in slots_a]
+        for b_rest in combinations(range(8), 4):
+            slots_b = tuple(rest[i] for i in b_rest)
+            b = _GROUP_INDEX[slots_b]
+            number = _REST_INDEX[b_rest]
+            rest_number[a * 495 + b] = number
+            from_number[a * 70 + number] = b
+            third[a * 495 + b] = _GROUP_INDEX[tuple(slot for slot in rest if slot not in slots_b)]
+    return rest_number, from_number, third
+
+_key_tables = None
+
+def key_tables():
+    """Move and key tables for 3x3 position keys (the move tables are stored like the solver tables)"""
+    global _key_tables
+    if _key_tables is None:
+        from app import solver
+        shared = solver.get_tables()
+        n_moves = len(MOVE_CUBES)
+        corner_move = tables.load(f'statespace_corner_move.v{VERSION}.u16', 'H', N_PERM_8 * n_moves, _gen_corner_move)
+        group_move = tables.load(f'statespace_group_move.v{VERSION}.u16', 'H', N_GROUP * n_moves, _gen_group_move)
+        _key_tables = (corner_move, shared.twist_move, shared.flip_move, group_move) + _gen_group_pairs()
+    return _key_tables
+
+def state_key(state):
+    """Key (perfect hash) of a 3x3 CubeState with its centres in place"""
+    from app.solver import CubieCube, twist_coord, flip_coord
+    cube = CubieCube.from_state(state)
+    rest_number = key_tables()[4]
+    a, b, c = (_group_coord(cube.ep, group) for group in range(3))
+    (slots_a, order_a), (slots_b, order_b) = divmod(a, 24), divmod(b, 24)
+    edges = (((slots_a * 70 + rest_number[slots_a * 495 + slots_b]) * 24 + order_a) * 24 + order_b) * 24 + c % 24
+    return ((perm_rank(cube.cp) * N_TWIST + twist_coord(cube.co)) * N_FLIP + flip_coord(cube.eo)) * N_EDGES + edges
+
+def _expand_keys(bucket, keys):
+    """
+    Keys one move away from keys (low bits, all in one bucket), as sorted
+    arrays of the distinct ones in each bucket
+    """
+    corner_move, twist_move, flip_move, group_move, rest_number, from_number, third = key_tables()
+    moves = _shared['moves']
+    n_moves = len(MOVE_CUBES)
+    high = bucket << KEY_BITS
+    found = set()
+    add = found.add
+    for key in keys:
+        key |= high
+        corners, edges = divmod(key, N_FLIP * N_EDGES)
+        flip, edges = divmod(edges, N_EDGES)
+        perm, twist = divmod(corners, N_TWIST)
+        edges, order_c = divmod(edges, 24)
+        edges, order_b = divmod(edges, 24)
+        edges, order_a = divmod(edges, 24)
+        slots_a, number = divmod(edges, 70)
+        slots_b = from_number[slots_a * 70 + number]
+        a = (slots_a * 24 + order_a) * n_moves
+        b = (slots_b * 24 + order_b) * n_moves
+        c = (third[slots_a * 495 + slots_b] * 24 + order_c) * n_moves
+        perm, twist, flip = perm * n_moves, twist * n_moves, flip * n_moves
+
+        for m in moves:
+            new_a, new_b = group_move[a + m], group_move[b + m]
+            slots_a, order_a = divmod(new_a, 24)
+            slots_b, order_b = divmod(new_b, 24)
+            edges = (((slots_a * 70 + rest_number[slots_a * 495 + slots_b]) * 24 + order_a) * 24 + order_b) * 24 + group_move[c + m] % 24
+            add(((corner_move[perm + m] * N_TWIST + twist_move[twist + m]) * N_FLIP + flip_move[flip + m]) * N_EDGES + edges)
+    return _split_buckets(sorted(found))
+
+def _expand_chunk(args):
+    return _expand_keys(*args)
+
+def _split_buckets(keys):
+    """Sorted keys as sorted arrays of their low bits, one per bucket"""
+    buckets = []
+    start = 0
+    for bucket in range(N_BUCKETS):
+        end = bisect_left(keys, (bucket + 1) << KEY_BITS, start)
+        high = bucket << KEY_BITS
+        buckets.append(array('Q', keys[start:end] if bucket == 0 else (key - high for key in islice(keys, start, end))))
+        start = end
+    return buckets
+
+def _merge(runs, exclude=()):
+    """Sorted array of the distinct values of sorted runs, leaving out any in the sorted arrays of exclude"""
+    merged = array('Q')
+    append = merged.append
+    excluded = heapq.merge(*exclude)
+    skip = next(excluded, None)
+    last = None
+    for value in heapq.merge(*runs):
+        if value == last:
+            continue
+        last = value
+        while skip is not None and skip < value:
+            skip = next(excluded, None)
+        if value != skip:
+            append(value)
+    return merged
+
+def _key_moves(state, moves):
+    """Indices of moves in solver.MOVE_NAMES if a search from state can use position keys (else None)"""
+    if state.size != 3 or any(state.facelets[face * 9 + 4] != face for face in range(6)):
+        return None
+    indices = {parse_move(name, 3): i for i, name in enumerate(MOVE_NAMES)}
+    moves = [indices.get(parse_move(move, 3)) for move in moves]
+    return None if None in moves else moves
+
+def _key_neighbourhood(state, depth, moves, processes, chunk_size, merge_runs=8):
+    """neighbourhood() of a 3x3 over position keys: levels are sorted arrays, about 8 bytes per position"""
+    key_tables() # Loaded before workers are forked
+    _shared['moves'] = moves
+    previous = [array('Q') for _ in range(N_BUCKETS)]
+    current = _split_buckets([state_key(state)])
+    distribution = [1]
+    pool = _pool(processes)
+    try:
+        for _ in range(depth):
+            chunks = ((bucket, keys[i:i + chunk_size]) for bucket, keys in enumerate(current) for i in range(0, len(keys), chunk_size))
+            if pool is None:
+                results = map(_expand_chunk, chunks)
+            else:
+                results = pool.imap_unordered(_expand_chunk, chunks)
+
+            # Each chunk's keys are a sorted run per bucket, merged (dropping the two last levels) as they pile up
+            runs = [[] for _ in range(N_BUCKETS)]
+            for found in results:
+                for bucket, run in enumerate(found):
+                    if run:
+                        runs[bucket].append(run)
+                        if len(runs[bucket]) > merge_runs:
+                            runs[bucket] = [_merge(runs[bucket], (previous[bucket], current[bucket]))]
+            new = [_merge(bucket_runs, (old, last)) for bucket_runs, old, last in zip(runs, previous, current)]
+            count = sum(map(len, new))
+            if not count:
+                break
+            previous, current = current, new
+            distribution.append(count)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _shared.clear()
+    return distribution
+
+# --- Neighbourhoods of any cube ---
+
+def face_moves():
+    """Outer layer turns of every face (the half turn metric move set)"""
+    return [face + suffix for face in 'LRUDFB' for suffix in ('', '2', '\'')]
+
+def _expand(states):
+    getters = _shared['getters']
+    found = set()
+    for state in states:
+        for getter in getters:
+            found.add(bytes(getter(state)))
+    return found
+
+def neighbourhood(state=None, depth=5, size=3, moves=None, processes=None, chunk_size=20000):
+    """
+    Number of positions at each distance (up to depth) from a CubeState (default solved)
+
+    moves defaults to face_moves(). 3x3 searches by outer layer turns (with
+    the centres in place) use position keys; other searches keep levels as
+    sets of facelet strings, about 14 times the memory.
+    """
+    if state is None:
+        state = CubeState(size)
+    size = state.size
+    moves = moves or face_moves()
+    key_moves = _key_moves(state, moves)
+    if key_moves is not None:
+        return _key_neighbourhood(state, depth, key_moves, processes, chunk_size)
+    _shared['getters'] = [itemgetter(*move_perm(size, *parse_move(move, size))) for move in moves]
+
+    previous, current = set(), {bytes(state.facelets)}
+    distribution = [1]
+    pool = _pool(processes)
+    try:
+        for _ in range(depth):
+            level = iter(current)
+            chunks = iter(lambda: list(islice(level, chunk_size)), [])
+            if pool is None:
+                results = map(_expand, chunks)
+            else:
+                results = pool.imap_unordered(_expand, chunks)
+
+            new = set()
+            for found in results:
+                new |= found
+            new -= current
+            new -= previous
+            if not new:
+                break
+            previous, current = current, new
+            distribution.append(len(new))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _shared.clear()
+    return distribution
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Count cube positions by distance from solved')
+    parser.add_argument('search', choices=('2x2', 'neighbourhood'))
+    parser.add_argument('--size', type=int, default=3, help='cube size for neighbourhood searches')
+    parser.add_argument('--depth', type=int, default=5, help='maximum distance for neighbourhood searches')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='worker processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    if args.search == '2x2':
+        counts = distribution_2x2(distance_table(args.processes))
+        print(f'Distance table in {tables.table_path(f"statespace_2x2.v{VERSION}.nib")}')
+    else:
+        counts = neighbourhood(depth=args.depth, size=args.size, processes=args.processes)
+
+    for dist, count in enumerate(counts):
+        print(f'{dist}\t{count}')
+    print(f'total\t{sum(counts)}')
+
+if __name__ == '__main__':
+    main()
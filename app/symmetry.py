@@ -0,0 +1,216 @@
+"""
+Cube symmetries, canonical state keys and a transposition cache
+
+The 48 symmetries of the cube (24 rotations, each with or without a mirror)
+act on a state by conjugation: the whole cube is rotated / mirrored and the
+colours are renamed to match, so the result is an equivalent position (eg.
+the same distance from solved). A state's canonical key is the smallest
+packed state (see CubeState.pack) over all its symmetric equivalents, so
+equivalent positions share one key.
+
+Optionally colours can be canonicalised too (renamed in order of first
+appearance), making states that only differ by a colour permutation equal.
+"""
+
+from collections import OrderedDict
+from functools import lru_cache
+from operator import itemgetter
+
+from app.state import CubeState, FACE_MOVES, facelet_index, move_perm, parse_move
+
+def _compose(first, second):
+    """Gather permutation applying first, then second"""
+    return tuple(first[i] for i in second)
+
+def _invert(perm):
+    inverse = [0] * len(perm)
+    for i, src in enumerate(perm):
+        inverse[src] = i
+    return tuple(inverse)
+
+def _mirror_perm(size, mirror_axis):
+    """Facelet permutation reflecting the cube across the plane perpendicular to an axis"""
+    perm = list(range(6 * size * size))
+    for axis in range(3):
+        for side in range(2):
+            for a in range(size):
+                for b in range(size):
+                    for c in range(size):
+                        pos = [a, b, c]
+                        i = facelet_index(size, pos, axis, side)
+                        if i is None:
+                            continue
+                        pos[mirror_axis] = size - 1 - pos[mirror_axis]
+                        new_side = side ^ 1 if axis == mirror_axis else side
+                        perm[facelet_index(size, pos, axis, new_side)] = i
+    return tuple(perm)
+
+class Symmetry:
+    """
+    A whole cube rotation / reflection, acting on states by conjugation
+
+    perm moves the facelets (gather form) and colours renames the colours,
+    so conjugating a solved state leaves it solved.
+    """
+
+    def __init__(self, size, perm):
+        self.size = size
+        self.perm = perm
+        self.inverse = _invert(perm)
+        self._getter = itemgetter(*perm)
+
+        # Facelet i takes the colour of facelet perm[i]; rename it to the colour that belongs at i
+        solved = CubeState(size).facelets
+        mapping = {solved[src]: solved[i] for i, src in enumerate(perm)}
+        self.colours = bytes.maketrans(bytes(mapping.keys()), bytes(mapping.values()))
+
+    def conjugate_facelets(self, facelets):
+        return bytes(self._getter(facelets)).translate(self.colours)
+
+    def conjugate(self, state):
+        """Symmetric equivalent of a CubeState"""
+        assert state.size == self.size, 'Symmetry for a different cube size'
+        return CubeState(self.size, self.conjugate_facelets(state.facelets))
+
+    def conjugate_moves(self, moves, inverse=False):
+        """
+        Moves solving the conjugated state, given moves solving the original (or back again if inverse)
+
+        Only moves naming a single layer (eg. 'R', '2R', 'U2') are supported.
+        """
+        move_map = _move_map(self.size, self.inverse if inverse else self.perm)
+        return [move_map[parse_move(move, self.size)] for move in moves]
+
+    def __repr__(self):
+        return f'<Symmetry size={self.size} perm={self.perm}>'
+
+def _single_layer_moves(size):
+    """{(axis, layers, turns): move string} for every single layer turn"""
+    moves = {}
+    for face, (axis, side) in FACE_MOVES.items():
+        for depth in range(size // 2 if size > 1 else 1):
+            for suffix in ('', '2', '\''):
+                move = f'{depth + 1 if depth else ""}{face}{suffix}'
+                moves[parse_move(move, size)] = move
+    if size % 2:
+        # Centre layers (only turned by slice moves on a 3x3)
+        for face, (axis, side) in FACE_MOVES.items():
+            if side == 0:
+                for suffix in ('', '2', '\''):
+                    move = f'{size // 2 + 1}{face}{suffix}'
+                    moves.setdefault(parse_move(move, size), move)
+    return moves
+
+@lru_cache(maxsize=None)
+def _move_map(size, perm):
+    """Each single layer move m mapped to the move equivalent to S m S^-1 (S: the facelet permutation perm)"""
+    moves = _single_layer_moves(size)
+    by_perm = {move_perm(size, *key): move for key, move in moves.items()}
+    inverse = _invert(perm)
+    move_map = {}
+    for key in moves:
+        # Turning the conjugated state by the mapped move = conjugating the turned state
+        mapped = _compose(_compose(inverse, move_perm(size, *key)), perm)
+        move_map[key] = by_perm[mapped]
+    return move_map
+
+@lru_cache(maxsize=None)
+def symmetries(size=3):
+    """All 48 symmetries of a size x size cube (the identity first)"""
+    last = tuple(range(size))
+    generators = [
+        move_perm(size, 0, last, 1), # Whole cube rotation around x
+        move_perm(size, 1, last, 1), # Whole cube rotation around y
+        _mirror_perm(size, 0),
+    ]
+
+    identity = tuple(range(6 * size * size))
+    found = {identity: None}
+    frontier = [identity]
+    while frontier:
+        new = []
+        for perm in frontier:
+            for gen in generators:
+                composed = _compose(perm, gen)
+                if composed not in found:
+                    found[composed] = None
+                    new.append(composed)
+        frontier = new
+    assert len(found) == 48, 'Symmetry group should have 48 elements'
+    return tuple(Symmetry(size, perm) for perm in found)
+
+def _canonical_colours(facelets):
+    """Rename colours in order of first appearance"""
+    order = dict.fromkeys(facelets)
+    return facelets.translate(bytes.maketrans(bytes(order), bytes(range(len(order)))))
+
+def canonicalise(state, colours=False):
+    """
+    (canonical key, symmetry) of a CubeState
+
+    The key is the smallest packed state over every symmetric equivalent,
+    and symmetry conjugates the state into the one with that key. If colours
+    is set, colours are also renamed in order of first appearance (so
+    equivalence under colour permutations is included).
+    """
+    best = best_sym = None
+    for sym in symmetries(state.size):
+        facelets = sym.conjugate_facelets(state.facelets)
+        if colours:
+            facelets = _canonical_colours(facelets)
+        if best is None or facelets < best:
+            best, best_sym = facelets, sym
+    return CubeState(state.size, best).pack(), best_sym
+
+def canonical_key(state, colours=False):
+    return canonicalise(state, colours)[0]
+
+class TranspositionCache:
+    """
+    Bounded cache of state -> (solution length, solution), shared by symmetric equivalents
+
+    Solution lengths are those of the solutions found (eg. by the two-phase
+    solver), so they are upper bounds on the distance from solved rather
+    than optimal distances. Entries are keyed on the canonical key, with the
+    solution stored for the canonical state, so one entry serves all 48
+    equivalent positions. The least recently used entries are evicted beyond
+    maxsize.
+    """
+
+    MAX_SIZE = 1 << 20
+
+    def __init__(self, maxsize=MAX_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, state):
+        """(solution length, solution for this state) or None - the solution is None if only the length was stored"""
+        key, sym = canonicalise(state)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+
+        solution_length, solution = entry
+        if solution is not None:
+            solution = sym.conjugate_moves(solution, inverse=True)
+        return solution_length, solution
+
+    def put(self, state, solution_length, solution=None):
+        key, sym = canonicalise(state)
+        if solution is not None:
+            solution = sym.conjugate_moves(solution)
+        self._entries[key] = (solution_length, solution)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, state):
+        return canonical_key(state) in self._entries
@@ -0,0 +1,52 @@
+"""
+Persistent lookup tables: generated once, stored as raw binary and memory mapped on load
+
+Tables are opened read-only with mmap, so pages are only read from disk when
+first accessed, and every process on a host shares the same physical memory.
+Files are in native byte order and are only meant to be shared between
+processes on the same host.
+"""
+
+import mmap
+import os
+from array import array
+
+TABLE_DIR = os.environ.get('RUBICKS_TABLE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'rubicks-python'))
+
+def table_path(name):
+    return os.path.join(TABLE_DIR, name)
+
+def load(name, typecode, length, build):
+    """
+    Memory map a stored table of `length` items, as a read-only memoryview
+
+    If the table is missing (or the wrong size), build() is called to
+    generate its contents (any buffer of the given typecode) and the result
+    is stored first.
+    """
+    path = table_path(name)
+    nbytes = length * array(typecode).itemsize
+    if not os.path.exists(path) or os.path.getsize(path) != nbytes:
+        save(path, array(typecode, build()))
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast(typecode)
+
+def save(path, data):
+    """Atomically write a table (a concurrent reader sees either no file or the whole file)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        data.tofile(f)
+    os.replace(tmp_path, path)
+
+def pack_nibbles(values):
+    """Pack values < 16 two per byte (even index in the low nibble)"""
+    values = bytes(values)
+    if len(values) % 2:
+        values += b'\0'
+    return bytes(low | high << 4 for low, high in zip(values[0::2], values[1::2]))
+
+def nibble(packed, i):
+    """Read value i of a nibble packed table"""
+    return packed[i >> 1] >> ((i & 1) << 2) & 15
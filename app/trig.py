@@ -1,6 +1,7 @@
 """A collection of trigonometry helper functions (all angles in degrees)"""
 
 import math
+from functools import lru_cache
 
 def sin(x):
     return math.sin(math.radians(x))
@@ -22,6 +23,54 @@ def atan2(y, x):
 
 def origin_rotate(x, y, angle):
     """Clockwise rotation around the origin"""
-    new_x = x * cos(angle) + y * sin(angle)
-    new_y = x * -sin(angle) + y * cos(angle)
-    return new_x, new_y
+    return rotation(angle).rotate(x, y)
+
+class Rotation:
+    """Clockwise rotation around the origin by a fixed angle, with its sine and cosine computed once"""
+
+    __slots__ = ('angle', 'cos', 'sin')
+
+    # (cos, sin) of each quarter turn, exact so quarter turns do not accumulate rounding errors
+    QUARTER_TURNS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+
+    def __init__(self, angle):
+        self.angle = angle
+        if angle % 90 == 0:
+            self.cos, self.sin = self.QUARTER_TURNS[int(angle // 90) % 4]
+        else:
+            self.cos, self.sin = cos(angle), sin(angle)
+
+    def rotate(self, x, y):
+        c, s = self.cos, self.sin
+        return x * c + y * s, x * -s + y * c
+
+    def rotate_points(self, points):
+        """Rotate a sequence of (x, y) points"""
+        c, s = self.cos, self.sin
+        return [(x * c + y * s, x * -s + y * c) for x, y in points]
+
+    def rotate_axes(self, dst, src, indices, axis_0, axis_1):
+        """
+        Rotate 3D points within the plane of two axes, in place
+
+        For each index i, dst[i] is set to src[i] rotated (the remaining
+        coordinate of dst[i] is left unchanged).
+        """
+        c, s = self.cos, self.sin
+        for i in indices:
+            vtx, orig = dst[i], src[i]
+            x, y = orig[axis_0], orig[axis_1]
+            vtx[axis_0] = x * c + y * s
+            vtx[axis_1] = x * -s + y * c
+
+    def __repr__(self):
+        return f'<Rotation {self.angle} deg>'
+
+@lru_cache(maxsize=256)
+def rotation(angle):
+    """Shared Rotation for an angle (memoised - the same few angles are used over and over)"""
+    return Rotation(angle)
+
+def rotate_points(points, angle):
+    """Rotate a sequence of (x, y) points clockwise around the origin"""
+    return rotation(angle).rotate_points(points)
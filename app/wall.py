@@ -0,0 +1,288 @@
+"""
+Multi-cube view: a grid of independent cubes in one window (eg. live sessions or a replay wall)
+
+Every cube is drawn from the shared CubeMesh of its size. A cube that is not
+turning matches the mesh exactly, so the projection and culling of the mesh
+are worked out once per camera and cell size (the template).
+Each cell offsets the template polygons to its position once per layout,
+and drawing a still cube is then just filling them with the colours of its
+state. Cubes part way through a turn only transform the vertices of the
+turning layers, with a view transform built once per cell, and are drawn
+as slabs of layers so nothing needs depth sorting.
+
+Cells are only redrawn when their cube changes.
+
+Usage: python -m app.wall [-n cubes] [--size 3] [--replay log ...] [--listen address]
+"""
+
+import argparse
+import asyncio
+import math
+import random
+
+from app.window import GameWindow, Color # Triggers initial pygame import
+import pygame as pg
+
+from app.projection import ViewTransform, is_front_facing
+from app.movelog import MoveLog, Replayer
+from app.cube import Cube, Block, cube_mesh
+from app.state import other_axes
+
+class WallTemplate:
+    """
+    Drawing plan for cubes of one size, seen from one camera
+
+    A cube is drawn as slabs: the whole cube while it is still, or the runs
+    of turning / still layers along the axis of a turn. Slabs are boxes
+    separated by planes, so drawing them furthest first, each as its front
+    faces (dark, filling the gaps between blocks) followed by the stickers
+    on them, needs no depth sort.
+    """
+
+    def __init__(self, mesh, view, camera_pos):
+        self.mesh = mesh
+        self.camera_pos = camera_pos
+        self.cam_verts = view.transform(mesh.verts) # Camera space does not depend on the screen centre
+        self._slabs = {}
+
+        # Still cube, for a view centred on (0, 0)
+        screen_verts = view.project(self.cam_verts)
+        self.hull = []
+        self.stickers = [] # (points, facelet index)
+        for box_face, body_diag, stickers in self.slabs(0, ())[0]:
+            if is_front_facing(self.cam_verts, box_face[::2], body_diag):
+                self.hull.append([screen_verts[v] for v in box_face])
+                self.stickers.extend(([screen_verts[v] for v in quad], facelet) for quad, facelet in stickers)
+
+        # Middle of the drawn cube, so it can be centred in a cell
+        xs = [x for points in self.hull for x, _ in points]
+        ys = [y for points in self.hull for _, y in points]
+        self.centre = ((min(xs) + max(xs)) / 2, (min(ys) + max(ys)) / 2)
+
+    def slabs(self, axis, layers):
+        """
+        Slabs in drawing order, while the layers (along an axis) turn
+
+        Each slab is a list of its box faces: (quad vertex indices, body
+        diagonal vertex indices, [(sticker quad, facelet index)]).
+        """
+        key = (axis, layers)
+        slabs = self._slabs.get(key)
+        if slabs is None:
+            slabs = self._slabs[key] = self._gen_slabs(axis, layers)
+        return slabs
+
+    def _gen_slabs(self, axis, layers):
+        mesh = self.mesh
+        last = mesh.size - 1
+
+        # Runs of layers that all turn or all stay still
+        runs = []
+        for layer in range(mesh.size):
+            if runs and (layer - 1 in layers) == (layer in layers):
+                runs[-1][1] = layer
+            else:
+                runs.append([layer, layer])
+        slab_of = {layer: i for i, (first, end) in enumerate(runs) for layer in range(first, end + 1)}
+
+        # Every sticker lies on the box face of its slab with the same axis and side
+        stickers = [[[] for _ in range(6)] for _ in runs]
+        for quad, pos, face_axis, side, facelet in mesh.stickers:
+            stickers[slab_of[pos[axis]]][face_axis * 2 + side].append((quad, facelet))
+
+        slabs = []
+        for (first, end), slab_stickers in zip(runs, stickers):
+            low, high = [0] * 3, [last] * 3
+            low[axis], high[axis] = first, end
+            body_diag = (mesh.box_corner(low, high, (0, 0, 0)), mesh.box_corner(low, high, (1, 1, 1)))
+
+            faces = []
+            for face_axis in range(3):
+                a, b = other_axes(face_axis)
+                for side in range(2):
+                    quad = []
+                    for u, v in ((0, 0), (0, 1), (1, 1), (1, 0)):
+                        corner = [0, 0, 0]
+                        corner[face_axis], corner[a], corner[b] = side, u, v
+                        quad.append(mesh.box_corner(low, high, corner))
+                    faces.append((tuple(quad), body_diag, slab_stickers[face_axis * 2 + side]))
+            slabs.append(faces)
+
+        # Camera on the low side of the axis: the high slabs are furthest away
+        if self.camera_pos[axis] < 0:
+            slabs.reverse()
+        return slabs
+
+    def offset(self, dx, dy):
+        """(hull polygons, stickers) of the still cube, centred on a point"""
+        dx -= self.centre[0]
+        dy -= self.centre[1]
+        hull = [[(x + dx, y + dy) for x, y in points] for points in self.hull]
+        stickers = [([(x + dx, y + dy) for x, y in points], facelet) for points, facelet in self.stickers]
+        return hull, stickers
+
+class CubeWall(GameWindow):
+    FPS = 30
+    BG_COL = Color.L_Gray
+    WINDOW_SIZE = (1024, 768)
+    DIRTY_RECTS = True
+
+    # Every cell has the same view of its cube (as in Game)
+    PITCH = 30
+    YAW = 45
+    CAM_POS = (-10, -8, -10)
+    ZOOM = 1.1 # Projection distance, in cell widths
+
+    STATE_RGB = [col.rgb_vals() for col in Block.STATE_COLS]
+    INTERIOR_RGB = Block.INTERIOR_COL.rgb_vals()
+
+    def __init__(self, cubes, columns=None, window_size=WINDOW_SIZE):
+        super().__init__(window_size)
+        self.set_window_title('Rubik\'s Cube Wall')
+        self.cubes = list(cubes)
+        self.replayers = [] # movelog.Replayers driving some of the cubes
+        self.layout(columns)
+
+    def layout(self, columns=None):
+        """Split the window into a grid of square cells (one per cube), and build their templates"""
+        count = max(1, len(self.cubes))
+        if columns is None:
+            # Largest cells that fit
+            columns = max(range(1, count + 1), key=lambda cols: min(self.width // cols, self.height // math.ceil(count / cols)))
+        rows = math.ceil(count / columns)
+        cell = min(self.width // columns, self.height // rows)
+
+        self.cells = [pg.Rect(i % columns * cell, i // columns * cell, cell, cell) for i in range(len(self.cubes))]
+        self.projection_dist = cell * self.ZOOM
+        self.cell_views = {}
+
+        view = self.view((0, 0))
+        self.templates = {size: WallTemplate(cube_mesh(size), view, self.CAM_POS) for size in {cube.size for cube in self.cubes}}
+        self.cell_polys = [self.templates[cube.size].offset(*rect.center) for cube, rect in zip(self.cubes, self.cells)]
+        self.full_redraw = True
+
+    def view(self, centre):
+        return ViewTransform(self.CAM_POS, self.YAW, self.PITCH, self.projection_dist, centre)
+
+    def cell_view(self, i):
+        """View transform of a cell, for drawing its cube part way through a turn"""
+        view = self.cell_views.get(i)
+        if view is None:
+            (x, y), (dx, dy) = self.cells[i].center, self.templates[self.cubes[i].size].centre
+            view = self.cell_views[i] = self.view((x - dx, y - dy))
+        return view
+
+    def add_replay(self, log, cube, start=0, speed=1.0):
+        self.replayers.append(Replayer(log, cube, start, speed))
+
+    def frame(self):
+        for evt in self.events:
+            if evt.type in (pg.VIDEOEXPOSE, pg.WINDOWEXPOSED):
+                self.full_redraw = True
+
+        for replayer in self.replayers:
+            replayer.update(self.dt)
+
+        if self.full_redraw:
+            self.screen.fill(self.BG_COL)
+
+        dirty = []
+        for i, cube in enumerate(self.cubes):
+            cube.update(self.dt)
+            if cube.changed or self.full_redraw:
+                self.draw_cell(i)
+                dirty.append(self.cells[i])
+
+        if self.full_redraw:
+            self.full_redraw = False
+            return [self.screen.get_rect()]
+        return dirty
+
+    def draw_cell(self, i):
+        cube, rect = self.cubes[i], self.cells[i]
+        self.screen.set_clip(rect)
+        self.screen.fill(self.BG_COL, rect)
+
+        if cube.is_moving:
+            self.draw_turning_cube(cube, self.cell_view(i))
+        else:
+            pen = self.pen
+            hull, stickers = self.cell_polys[i]
+            for points in hull:
+                pen.draw_polygon(points, col=self.INTERIOR_RGB)
+            cols, facelets = self.STATE_RGB, cube.state.facelets
+            for points, facelet in stickers:
+                pen.draw_polygon(points, col=cols[facelets[facelet]])
+
+        self.screen.set_clip(None)
+        cube.changed = False
+
+    def draw_turning_cube(self, cube, view):
+        """Draw a cube part way through a turn - only the vertices of the turning layers are transformed"""
+        template = self.templates[cube.size]
+        cam_verts = list(template.cam_verts)
+        verts, moving = cube.verts, cube.move_verts
+        for v, cam in zip(moving, view.transform([verts[v] for v in moving])):
+            cam_verts[v] = cam
+        screen_verts = view.project(cam_verts)
+
+        pen = self.pen
+        cols, facelets = self.STATE_RGB, cube.state.facelets
+        for slab in template.slabs(cube.move_axis, cube.move_layers):
+            for box_face, body_diag, stickers in slab:
+                if is_front_facing(cam_verts, box_face[::2], body_diag):
+                    pen.draw_polygon([screen_verts[v] for v in box_face], col=self.INTERIOR_RGB)
+                    for quad, facelet in stickers:
+                        pen.draw_polygon([screen_verts[v] for v in quad], col=cols[facelets[facelet]])
+
+async def shuffle(cube, rng=random, interval=0.5):
+    """Demo move source: keep turning random faces"""
+    faces = list(cube.moves)
+    while True:
+        if not cube.move_queue and not cube.is_moving:
+            cube.move_queue.append(rng.choice(faces) + rng.choice(('', '2', '\'')))
+        await asyncio.sleep(interval * rng.random())
+
+def listen_address(address, i):
+    """Address of cube i's move source: consecutive ports from host:port, or <path>.<i> for unix sockets"""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return f'{host}:{int(port) + i}'
+    return f'{address}.{i}'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show a grid of cubes in one window')
+    parser.add_argument('-n', '--count', type=int, default=16, help='number of cubes (default: one per replay log)')
+    parser.add_argument('--size', type=int, default=3, help='cube size')
+    parser.add_argument('--replay', nargs='+', metavar='LOG', help='play back move logs, one per cube')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed')
+    parser.add_argument('--listen', metavar='ADDRESS', help='accept moves for each cube (see app.sources) on host:port+i or <path>.i')
+    parser.add_argument('--seed', help='seed for the demo moves (when not replaying or listening)')
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        logs = [MoveLog(path) for path in args.replay]
+        wall = CubeWall(Cube(log.size) for log in logs)
+        for log, cube in zip(logs, wall.cubes):
+            wall.add_replay(log, cube, speed=args.speed)
+        for cube in wall.cubes:
+            cube.fast_forward = True
+    else:
+        wall = CubeWall(Cube(args.size) for _ in range(args.count))
+
+    if args.listen:
+        from app import sources
+        tasks = [sources.serve(cube, listen_address(args.listen, i)) for i, cube in enumerate(wall.cubes)]
+    elif not args.replay:
+        rng = random.Random(args.seed)
+        tasks = [shuffle(cube, random.Random(rng.random())) for cube in wall.cubes]
+    else:
+        tasks = []
+    try:
+        asyncio.run(wall.run_async(*tasks))
+    finally:
+        if args.listen:
+            sources.shutdown_executor()
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@
 
 import os
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
+import asyncio
+from collections import OrderedDict
 import pygame as pg
 
 class Color:
@@ -31,12 +33,18 @@ class GameWindow:
     BG_COL = Color.White
     FPS = 60
 
+    # When set, frame() only redraws what changed (nothing is cleared beforehand),
+    # and returns the list of screen rects to push to the display
+    DIRTY_RECTS = False
+
     def __init__(self, geometry):
         pg.init()
         self._geometry = geometry
         self.screen = pg.display.set_mode(geometry)
         self.pen = _Pen(self.screen)
         self.events = []
+        self.dt = 1 / self.FPS # Seconds since the previous frame
+        self.profiler = None # Optional app.profiler.Profiler, told when each frame ends
         self._running = True
 
     def set_window_title(self, title):
@@ -53,19 +61,85 @@ class GameWindow:
     def run(self):
         clock = pg.time.Clock()
 
-        while self._running:
+        try:
+            while self._running:
+                self.step()
+                self.dt = clock.tick(self.FPS) / 1000
+        finally:
+            self.on_exit()
 
-            # Check for window quit
-            self.events = pg.event.get()
-            for event in self.events:
-                if event.type == pg.QUIT:
-                    self._running = False
+    async def run_async(self, *sources):
+        """
+        Run the window on the asyncio event loop, alongside other coroutines (eg. move sources)
 
+        Frames are paced by awaiting (rather than blocking in clock.tick), so
+        the sources run in the time between frames. They are cancelled when
+        the window closes. A source that fails (eg. a server that could not
+        listen) closes the window, and its exception is raised once the
+        window has shut down.
+        """
+        loop = asyncio.get_running_loop()
+        tasks = [asyncio.ensure_future(source) for source in sources]
+        failed = []
+
+        def source_done(task):
+            if not task.cancelled() and task.exception() is not None:
+                failed.append(task.exception())
+                self.quit()
+
+        for task in tasks:
+            task.add_done_callback(source_done)
+        frame_time = 1 / self.FPS
+        last = loop.time()
+        try:
+            while self._running:
+                self.step()
+                await asyncio.sleep(max(0, last + frame_time - loop.time()))
+                now = loop.time()
+                self.dt = now - last
+                last = now
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.on_exit()
+        if failed:
+            raise failed[0]
+
+    def step(self):
+        """Handle events and draw a single frame"""
+        if self.profiler:
+            self.profiler.start_frame()
+
+        # Check for window quit
+        self.events = pg.event.get()
+        for event in self.events:
+            if event.type == pg.QUIT:
+                self._running = False
+
+        if self.DIRTY_RECTS:
+            dirty = self.frame()
+            if dirty:
+                self.present(dirty)
+        else:
             self.screen.fill(self.BG_COL)
             self.frame()
-            pg.display.update()
+            self.present()
 
-            clock.tick(self.FPS)
+        if self.profiler:
+            self.profiler.end_frame()
+
+    def on_exit(self):
+        """Called once the window loop has finished"""
+        if self.profiler:
+            self.profiler.uninstall()
+
+    def present(self, rects=None):
+        """Push the frame (or the given screen rects) to the display"""
+        if rects is None:
+            pg.display.update()
+        else:
+            pg.display.update(rects)
 
     def frame(self):
         raise NotImplementedError('The frame method must be overridden')
@@ -73,6 +147,17 @@ class GameWindow:
     def quit(self):
         self._running = False
 
+class Layer:
+    """Offscreen surface (with its own pen) for pre-rendering parts of a frame (by default at the display's bit depth)"""
+
+    def __init__(self, size, pos=(0, 0), depth=None):
+        self.pos = pos
+        self.surface = pg.Surface(size) if depth is None else pg.Surface(size, 0, depth)
+        self.pen = _Pen(self.surface)
+
+    def blit(self, screen):
+        screen.blit(self.surface, self.pos)
+
 class _Pen:
     """Wrapper functions for drawing to a PyGame surface - class not accessable to main program"""
 
@@ -93,28 +178,31 @@ class _Pen:
         pg.draw.rect(self.screen, col, rect, width=width)
 
 class Font:
-    """Class for rendering fonts"""
+    """Class for rendering fonts - rendered text is cached, so each label is only rasterised once"""
 
-    def __init__(self, screen, font_dir, size=23):
+    CACHE_SIZE = 256
+
+    def __init__(self, screen, font_dir, size=23, cache_size=CACHE_SIZE):
         self.screen = screen
         self.font = pg.font.Font(font_dir, size)
 
-    def render(self, text, x, y, col=(0, 0, 0), x_anchor='left', y_anchor='top'):
-        """
-        Render the font on the screen
-
-        Anchors:
-        X: ('left', 'center', 'right')
-        Y: ('top', 'center', 'bottom')
-        """
+        # (text, col, x_anchor, y_anchor): (surface, anchor offset), least recently used first
+        self._cache = OrderedDict()
+        self.cache_size = cache_size
 
-        if not text: # No text to render
-            return
+    def get_text(self, text, col=(0, 0, 0), x_anchor='left', y_anchor='top'):
+        """Rendered text surface and the offset of its top left corner from the anchor point"""
+        key = (text, tuple(col), x_anchor, y_anchor)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
 
         textsurface = self.font.render(text, True, col)
         width, height = textsurface.get_rect()[2:4]
 
         # (x, y) parameters are automatically anchored at top left - adjust if necessary:
+        x = y = 0
 
         if x_anchor == 'center':
             x -= int(width / 2)
@@ -126,4 +214,22 @@ class Font:
         elif y_anchor == 'bottom':
             y -= height
 
-        self.screen.blit(textsurface, (x, y))
+        cached = self._cache[key] = textsurface, (x, y)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return cached
+
+    def render(self, text, x, y, col=(0, 0, 0), x_anchor='left', y_anchor='top', surface=None):
+        """
+        Render the font on the screen (or another surface)
+
+        Anchors:
+        X: ('left', 'center', 'right')
+        Y: ('top', 'center', 'bottom')
+        """
+
+        if not text: # No text to render
+            return
+
+        textsurface, (dx, dy) = self.get_text(text, col, x_anchor, y_anchor)
+        (surface or self.screen).blit(textsurface, (x + dx, y + dy))
@@ -1,4 +1,7 @@
+import sys
+
 from app import run
 
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    # Optional argument: number of blocks along each edge of the cube (default 3)
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
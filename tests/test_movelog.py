@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+
+from app.cube import Cube
+from app.movelog import CHECKPOINT, MoveLog, MoveRecorder, Replayer
+from app.state import CubeState
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 0.25
+        return self.now
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'moves.rbxl')
+        self.clock = Clock()
+
+    def record(self, moves, state=None, jump=None):
+        """Record a session: moves, then a set_state jump (if given) and the moves again"""
+        cube = Cube(3)
+        if state is not None:
+            cube.set_state(state)
+        cube.recorder = MoveRecorder(self.path, 3, cube.state, checkpoint_interval=4, clock=self.clock, wall_clock=self.clock)
+        cube.apply_moves(moves)
+        if jump is not None:
+            cube.set_state(jump)
+            cube.apply_moves(moves)
+        cube.recorder.close()
+        return cube.state
+
+    def replay(self, start=0):
+        cube = Cube(3)
+        replayer = Replayer(MoveLog(self.path), cube, start)
+        while not replayer.finished:
+            replayer.update(0.1)
+            cube.update(0.1)
+        cube.finish_move()
+        cube.skip_queue()
+        return cube.state
+
+    def test_sessions_and_jumps(self):
+        jump = CubeState(3)
+        jump.apply_sequence('F B2 L\''.split())
+        self.record('R U R\' U\' F2'.split(), jump=jump)
+
+        second = CubeState(3)
+        second.apply_sequence('D L2'.split())
+        final = self.record('U2 R\' B'.split(), state=second)
+
+        log = MoveLog(self.path)
+        self.assertEqual(log.final_state(), final)
+        self.assertEqual(self.replay(), final)
+        for start in range(len(log)):
+            self.assertEqual(self.replay(start), final)
+
+    def test_checkpoints_repeating_the_state(self):
+        final = self.record('R U R\' U\' F2 D B\' L2 U R'.split())
+        events = list(MoveLog(self.path).events())
+        self.assertTrue(all(isinstance(code, int) for _, _, code in events))
+        self.assertEqual([number for number, _, _ in events], list(range(10)))
+        self.assertEqual(self.replay(), final)
+
+    def test_append_after_cut_off_event(self):
+        for tail in (b'\x7e', b'\x7e\x05', bytes([CHECKPOINT, 7, 0, 1])):
+            with self.subTest(tail=tail):
+                self.record('R U R\' U\' F2'.split())
+                with open(self.path, 'ab') as f:
+                    f.write(tail)
+                final = self.record('B L\''.split())
+
+                log = MoveLog(self.path)
+                self.assertEqual(len(log), 7)
+                self.assertEqual(log.valid_length(), len(log.data))
+                self.assertEqual(log.final_state(), final)
+                self.assertEqual(self.replay(), final)
+                os.remove(self.path)
+                os.remove(self.path + '.idx')
+
+    def test_system_time_going_back(self):
+        wall_clock = Clock()
+        cube = Cube(3)
+        cube.recorder = MoveRecorder(self.path, 3, clock=self.clock, wall_clock=wall_clock)
+        cube.apply_moves('R U'.split())
+        wall_clock.now -= 3600
+        cube.apply_moves('F D'.split())
+        cube.recorder.close()
+
+        times = [time for _, time, _ in MoveLog(self.path).events()]
+        self.assertEqual(times, sorted(times))
+        self.assertEqual(self.replay(), cube.state)
+
+    def test_moves_reach_the_file_as_recorded(self):
+        cube = Cube(3)
+        cube.recorder = MoveRecorder(self.path, 3, clock=self.clock, wall_clock=self.clock)
+        self.addCleanup(cube.recorder.close)
+        cube.apply_moves('R U F'.split())
+        log = MoveLog(self.path)
+        self.assertEqual(len(log), 3)
+        self.assertEqual(log.final_state(), cube.state)
+
+    def test_gap_between_sessions(self):
+        self.record('R U'.split())
+        self.clock.now += 24 * 3600
+        final = self.record('F D'.split())
+
+        cube = Cube(3)
+        replayer = Replayer(MoveLog(self.path), cube)
+        for _ in range(100):
+            replayer.update(0.1)
+        self.assertTrue(replayer.finished)
+        cube.finish_move()
+        cube.skip_queue()
+        self.assertEqual(cube.state, final)
+
+    def test_append_to_cut_off_header(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'RBXL\x01')
+        final = self.record('R U'.split())
+        self.assertEqual(MoveLog(self.path).final_state(), final)
+
+if __name__ == '__main__':
+    unittest.main()
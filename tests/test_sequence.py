@@ -0,0 +1,94 @@
+import random
+import unittest
+
+from app.sequence import CompiledSequence, MoveQueue, compile_moves, decode, encode, format_moves, merge_tail, parse
+from app.state import CubeState
+
+MOVES = ['R', 'L', 'U', 'D', 'F', 'B', 'M', 'E', 'S', 'Rw', 'Uw', '2R', '2F', '3Rw']
+
+def random_moves(size, rng, length=30):
+    moves = []
+    for _ in range(length):
+        move = rng.choice(MOVES)
+        try:
+            parse([move], size)
+        except ValueError: # Not a move on this size of cube
+            continue
+        moves.append(move + rng.choice(('', '2', '\'')))
+    return moves
+
+def random_codes(size, rng, length=30):
+    """Turns of any set of layers (many have no single move in cube notation)"""
+    codes = []
+    for _ in range(length):
+        layers = rng.sample(range(size), rng.randint(1, size))
+        codes.append(encode(rng.randrange(3), layers, rng.randint(1, 3)))
+    return codes
+
+def parse_one(move, size=3):
+    return parse([move], size)[0]
+
+def applied(size, moves):
+    state = CubeState(size)
+    state.apply_sequence(moves)
+    return state
+
+class SequenceTest(unittest.TestCase):
+    def test_merge_tail(self):
+        codes = parse('R L')
+        self.assertEqual(merge_tail(codes, parse_one('R\'')), parse('L'))
+        self.assertEqual(codes, [])
+
+        codes = parse('R U')
+        codes.extend(merge_tail(codes, parse_one('U')))
+        self.assertEqual(codes, parse('R U2'))
+        self.assertEqual(compile_moves('R U U\' R\''), [])
+        self.assertEqual(compile_moves('R L R\''), parse('L'))
+        self.assertEqual(compile_moves('R R'), parse('R2'))
+        self.assertEqual(compile_moves('R L\' R\' L'), [])
+
+        # A move on another axis is kept
+        codes = parse('R')
+        self.assertEqual(merge_tail(codes, parse_one('U')), parse('U'))
+        self.assertEqual(codes, parse('R'))
+
+    def test_move_queue(self):
+        queue = MoveQueue(3, 'R U U\'')
+        queue.append('R\'')
+        self.assertEqual(list(queue), [])
+        queue.extend(['F', 'B', 'F\''])
+        self.assertEqual(list(queue), parse('B'))
+
+    def test_compiled_sequence(self):
+        rng = random.Random(1)
+        for size in range(2, 6):
+            for _ in range(10):
+                moves = random_moves(size, rng)
+                with self.subTest(size=size, moves=moves):
+                    state = CubeState(size)
+                    CompiledSequence(moves, size).apply(state)
+                    self.assertEqual(state, applied(size, moves))
+
+    def test_format_round_trip(self):
+        rng = random.Random(2)
+        for size in range(2, 8):
+            for _ in range(10):
+                codes = compile_moves(random_codes(size, rng), size)
+                with self.subTest(size=size, codes=codes):
+                    moves = format_moves(codes, size)
+                    self.assertEqual(compile_moves(moves, size), codes)
+
+                    expected = CubeState(size)
+                    for code in codes:
+                        expected.apply_turn(*decode(code))
+                    self.assertEqual(applied(size, moves), expected)
+
+    def test_notation_round_trip(self):
+        for size in range(2, 8):
+            for count in range(1, size + 1):
+                moves = [f'{count}R', f'{count}Uw\'', f'{count}F2', f'{count}Lw', f'{count}D\'']
+                if size > 2:
+                    moves += ['M', 'E2', 'S\'']
+                with self.subTest(size=size, count=count):
+                    codes = parse(moves, size)
+                    self.assertEqual(parse(format_moves(codes, size), size), codes)
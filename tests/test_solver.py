@@ -0,0 +1,58 @@
+import random
+import unittest
+
+from app import solver
+from app.scramble import random_state
+from app.state import CubeState
+
+def solves(state, moves):
+    state = state.copy()
+    state.apply_sequence(moves)
+    return state == CubeState(3)
+
+def scrambled(moves):
+    state = CubeState(3)
+    state.apply_sequence(moves.split())
+    return state
+
+class SolverTest(unittest.TestCase):
+    def test_random_states(self):
+        rng = random.Random(1)
+        states = [random_state(3, rng) for _ in range(3)]
+        for state, solution in zip(states, solver.solve_many(states)):
+            self.assertLessEqual(len(solution), 24)
+            self.assertTrue(solves(state, solution))
+
+    def test_short_scrambles(self):
+        self.assertEqual(solver.solve(CubeState(3)), [])
+        self.assertEqual(solver.solve(scrambled('R')), ['R\''])
+        self.assertEqual(solver.solve(scrambled('R U')), ['U\'', 'R\''])
+        self.assertEqual(len(solver.solve(scrambled('R U R\' U\''))), 4)
+        self.assertEqual(len(solver.solve(scrambled('F2 L\' B D R2'))), 5)
+
+    def test_optimal(self):
+        rng = random.Random(2)
+        moves = solver.MOVE_NAMES
+        for length in range(1, 8):
+            state = scrambled(' '.join(rng.choice(moves) for _ in range(length)))
+            solution = solver.solve(state, optimal=True)
+            self.assertTrue(solves(state, solution))
+            self.assertLessEqual(len(solution), length)
+            self.assertGreaterEqual(len(solver.solve(state)), len(solution))
+
+        # 'R U R U' has no shorter solution than its inverse
+        self.assertEqual(len(solver.solve(scrambled('R U R U'), optimal=True)), 4)
+
+    def test_max_length(self):
+        state = scrambled('R U F L D B')
+        self.assertIsNone(solver.solve(state, max_length=5, optimal=True))
+        self.assertEqual(len(solver.solve(state, max_length=6, optimal=True)), 6)
+
+    def test_invalid_state(self):
+        state = CubeState(3)
+        state.facelets[0], state.facelets[-1] = state.facelets[-1], state.facelets[0]
+        with self.assertRaises(ValueError):
+            solver.solve(state)
+
+if __name__ == '__main__':
+    unittest.main()
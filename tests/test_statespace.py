@@ -0,0 +1,32 @@
+import unittest
+from unittest import mock
+
+from app import statespace
+from app.state import CubeState
+
+class NeighbourhoodTest(unittest.TestCase):
+    def test_known_counts(self):
+        self.assertEqual(statespace.neighbourhood(depth=4, processes=1), [1, 18, 243, 3240, 43239])
+
+    def test_keys_match_facelet_search(self):
+        state = CubeState(3)
+        state.apply_sequence('R U F\''.split())
+        for moves in (None, ['R', 'U2', 'F\'']):
+            with self.subTest(moves=moves):
+                by_keys = statespace.neighbourhood(state, depth=3, moves=moves, processes=1)
+                with mock.patch.object(statespace, '_key_moves', return_value=None):
+                    by_facelets = statespace.neighbourhood(state, depth=3, moves=moves, processes=1)
+                self.assertEqual(by_keys, by_facelets)
+
+    def test_state_keys(self):
+        keys = set()
+        state = CubeState(3)
+        for move in 'R U F\' L2 D B R\''.split():
+            keys.add(statespace.state_key(state))
+            state.apply(move)
+        self.assertEqual(len(keys), 7)
+        self.assertLess(max(keys), statespace.N_KEYS)
+        self.assertEqual(statespace.state_key(CubeState(3)), statespace.state_key(CubeState(3)))
+
+if __name__ == '__main__':
+    unittest.main()
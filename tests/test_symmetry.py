@@ -0,0 +1,110 @@
+import random
+import unittest
+
+from app import solver
+from app.scramble import random_state
+from app.state import CubeState
+from app.symmetry import TranspositionCache, canonical_key, canonicalise, symmetries
+
+INVERSE_SUFFIX = {'': '\'', '2': '2', '\'': ''}
+
+def scramble(size, rng, length=20):
+    """Random single layer moves (the only moves conjugate_moves supports), and the moves undoing them"""
+    moves, undo = [], []
+    for _ in range(length):
+        depth = rng.randrange(size // 2)
+        move = f'{depth + 1 if depth else ""}{rng.choice("RLUDFB")}'
+        suffix = rng.choice(tuple(INVERSE_SUFFIX))
+        moves.append(move + suffix)
+        undo.insert(0, move + INVERSE_SUFFIX[suffix])
+    return moves, undo
+
+def scrambled(size, moves):
+    state = CubeState(size)
+    state.apply_sequence(moves)
+    return state
+
+def solves(state, moves):
+    state = state.copy()
+    state.apply_sequence(moves)
+    return state.is_solved()
+
+class SymmetryTest(unittest.TestCase):
+    def test_solved_is_fixed(self):
+        for size in (2, 3, 4):
+            solved = CubeState(size)
+            for sym in symmetries(size):
+                self.assertEqual(sym.conjugate(solved), solved)
+
+    def test_equivalents_share_a_key(self):
+        rng = random.Random(1)
+        for size in (2, 3, 4):
+            state = scrambled(size, scramble(size, rng)[0])
+            key = canonical_key(state)
+            for sym in symmetries(size):
+                with self.subTest(size=size, sym=sym):
+                    conjugate = sym.conjugate(state)
+                    self.assertEqual(canonical_key(conjugate), key)
+
+                    # The returned symmetry takes each equivalent to the canonical state
+                    key, canonical_sym = canonicalise(conjugate)
+                    self.assertEqual(canonical_sym.conjugate(conjugate).pack(), key)
+
+    def test_conjugate_moves(self):
+        rng = random.Random(2)
+        for size in (2, 3, 4, 5):
+            moves, undo = scramble(size, rng)
+            state = scrambled(size, moves)
+            for sym in symmetries(size):
+                with self.subTest(size=size, sym=sym):
+                    conjugate = sym.conjugate(state)
+                    mapped = sym.conjugate_moves(undo)
+                    self.assertTrue(solves(conjugate, mapped))
+                    self.assertEqual(sym.conjugate_moves(mapped, inverse=True), undo)
+
+class TranspositionCacheTest(unittest.TestCase):
+    def test_solutions_remapped(self):
+        rng = random.Random(3)
+        for size in (3, 4):
+            cache = TranspositionCache()
+            moves, undo = scramble(size, rng)
+            state = scrambled(size, moves)
+            cache.put(state, len(undo), undo)
+            for sym in symmetries(size):
+                with self.subTest(size=size, sym=sym):
+                    conjugate = sym.conjugate(state)
+                    self.assertIn(conjugate, cache)
+                    length, solution = cache.get(conjugate)
+                    self.assertEqual(length, len(undo))
+                    self.assertTrue(solves(conjugate, solution))
+            self.assertEqual(len(cache), 1)
+
+    def test_length_only(self):
+        cache = TranspositionCache()
+        state = scrambled(3, ['R', 'U'])
+        self.assertIsNone(cache.get(state))
+        cache.put(state, 2)
+        self.assertEqual(cache.get(symmetries(3)[5].conjugate(state)), (2, None))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_eviction(self):
+        cache = TranspositionCache(maxsize=2)
+        states = [scrambled(3, moves.split()) for moves in ('R', 'R2', 'R U')]
+        for state in states:
+            cache.put(state, 1)
+        self.assertNotIn(states[0], cache)
+        self.assertIn(states[2], cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_solver_cache(self):
+        rng = random.Random(4)
+        cache = TranspositionCache()
+        state = random_state(3, rng)
+        solution = solver.solve(state, cache=cache)
+        for sym in symmetries(3)[1::7]:
+            with self.subTest(sym=sym):
+                conjugate = sym.conjugate(state)
+                cached = solver.solve(conjugate, cache=cache)
+                self.assertEqual(len(cached), len(solution))
+                self.assertTrue(solves(conjugate, cached))
+        self.assertEqual(len(cache), 1)